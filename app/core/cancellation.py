@@ -0,0 +1,76 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+from app.core.exceptions import RequestCancelledError
+from app.core.metrics import metrics
+
+# 取消原因
+CANCEL_DEADLINE = "deadline"
+CANCEL_DISCONNECT = "disconnect"
+CANCEL_CLIENT = "client"
+# 任务租约过期并可能已被其他 worker 领取
+CANCEL_LEASE_LOST = "lease_lost"
+# worker 进程收到终止信号
+CANCEL_SHUTDOWN = "shutdown"
+
+
+class CancellationToken:
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        请求级别的取消标记，超过截止时间或被显式取消后，后续的合成工作都应停止
+
+        参数:
+            timeout: 距截止时间的秒数，为空或不大于0时不设截止时间
+        """
+        self.deadline = time.monotonic() + timeout if timeout and timeout > 0 else None
+        self.reason: Optional[str] = None
+        self._event = asyncio.Event()
+
+    def cancel(self, reason: str = CANCEL_CLIENT):
+        """取消请求，只有第一次调用生效并计入指标"""
+        if self.reason is not None:
+            return
+        self.reason = reason
+        self._event.set()
+        metrics.inc("tts_cancellations_total", {"reason": reason})
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(CANCEL_DEADLINE)
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的剩余秒数，没有截止时间时返回 None"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise RequestCancelledError(self.reason)
+
+    async def wait(self):
+        """等待直到请求被取消(包括到达截止时间)"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=self.remaining())
+        except asyncio.TimeoutError:
+            self.cancel(CANCEL_DEADLINE)
+
+
+@asynccontextmanager
+async def watch_disconnect(request, token: CancellationToken, interval: float = 0.5):
+    """在上下文内定期检查客户端是否断开连接，断开时取消请求"""
+    async def poll():
+        while not token.cancelled:
+            if await request.is_disconnected():
+                token.cancel(CANCEL_DISCONNECT)
+                return
+            await asyncio.sleep(interval)
+
+    task = asyncio.create_task(poll())
+    try:
+        yield token
+    finally:
+        task.cancel()
@@ -32,6 +32,96 @@ class Settings(BaseSettings):
         description="流媒体音频文件的基础URL"
     )
 
+    # 多码率(ABR)流媒体相关配置
+    HLS_RENDITIONS: str = Field(
+        default="aac_64k,mp3_128k,aac_24k",
+        description="启用的码率档位，逗号分隔；其中可用于HLS的档位(AAC、MP3)出现在主播放列表中"
+    )
+    RENDITION_CACHE_DIR: str = Field(
+        default="",
+        description="转码后音频的缓存目录，为空时使用项目目录下的 .renditions"
+    )
+    RENDITION_CACHE_MAX_MB: float = Field(
+        default=1024.0,
+        description="转码缓存的最大容量(MB)，超出后按最近最少使用淘汰"
+    )
+
+    # 请求截止时间
+    REQUEST_TIMEOUT_SECONDS: float = Field(
+        default=600.0,
+        description="合成请求的默认超时时间(秒)，可被表单字段 timeout 或请求头 X-Request-Timeout 覆盖，不大于0表示不限制；提交到任务队列的任务只在客户端显式指定时设置截止时间"
+    )
+
+    # 流式合成相关配置
+    SPARK_TTS_STREAM_WORKER: str = Field(
+        default="spark",
+        description="流式推理worker，spark 使用 Spark-TTS 模型，stub 使用不加载模型的桩worker"
+    )
+    STREAM_STUB_WORKER_ARGS: str = Field(
+        default="",
+        description="传给桩worker的额外命令行参数，如 \"--delay 0.1 --fail_after 3\"，用于模拟生成耗时和出错"
+    )
+    STREAM_CHUNK_TOKENS: int = Field(
+        default=25,
+        description="流式推理时每累计多少个语义token输出一次音频块(50个约为1秒)"
+    )
+    STREAM_WORKERS: int = Field(
+        default=1,
+        description="每个API进程中常驻的流式推理worker数，每个worker加载一份模型、同时服务一个流式请求"
+    )
+
+    # 动态批量相关配置
+    BATCHING_ENABLED: bool = Field(
+        default=False,
+        description="为 true 时由常驻的批量推理worker合并不同请求的句子批量生成"
+    )
+    SPARK_TTS_BATCH_WORKER: str = Field(
+        default="spark",
+        description="批量推理worker，spark 使用 Spark-TTS 模型，stub 使用不加载模型的桩worker"
+    )
+    BATCH_MAX_SIZE: int = Field(default=8, description="批大小上限")
+    BATCH_MAX_WAIT_MS: float = Field(
+        default=20.0,
+        description="句子等待凑批的最长时间(毫秒)"
+    )
+    BATCH_LENGTH_BUCKET: int = Field(
+        default=50,
+        description="按文本长度分组的字符数区间，同一区间的句子才合并，不大于0时不按长度分组"
+    )
+    WORKER_CONCURRENCY: int = Field(
+        default=1,
+        description="每个合成worker进程同时执行的任务数，启用动态批量时可调大以便跨任务合并"
+    )
+
+    # 任务队列相关配置
+    JOB_BROKER_ENABLED: bool = Field(
+        default=False,
+        description="为 true 时合成请求写入任务队列，由独立的 worker 进程执行"
+    )
+    JOB_BROKER_BACKEND: str = Field(
+        default="sqlite",
+        description="任务队列实现，sqlite 或 \"模块路径:类名\""
+    )
+    JOB_BROKER_URL: str = Field(
+        default="",
+        description="SQLite 数据库文件路径，为空时使用项目目录下的 jobs.sqlite3"
+    )
+    JOB_VISIBILITY_TIMEOUT: float = Field(
+        default=300.0,
+        description="任务租约的可见性超时(秒)，超时未完成的任务会被其他 worker 重新领取"
+    )
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF: float = 5.0
+    WORKER_POLL_INTERVAL: float = 1.0
+    WORKER_METRICS_HOST: str = Field(
+        default="0.0.0.0",
+        description="合成worker输出指标的监听地址"
+    )
+    WORKER_METRICS_PORT: int = Field(
+        default=0,
+        description="合成worker输出指标(GET /metrics)的端口，为0时不启动；同一主机上的多个worker需使用不同端口"
+    )
+
     @property
     def PROJECT_FILES_DIR(self) -> str:
         """获取项目文件的存储目录"""
@@ -21,6 +21,22 @@ class ProjectNotFoundError(Exception):
     def __init__(self, project_id: str):
         self.message = f"Project {project_id} not found"
 
+class JobNotFoundError(Exception):
+    """请求的任务不存在错误"""
+    def __init__(self, job_id: str):
+        self.message = f"Job {job_id} not found"
+
+class ProjectBusyError(Exception):
+    """项目正被其他任务占用错误"""
+    def __init__(self, project_id: str):
+        self.message = f"Project {project_id} is busy with another job"
+
+class RequestCancelledError(Exception):
+    """请求超过截止时间或被取消"""
+    def __init__(self, reason: str):
+        self.reason = reason
+        self.message = f"Request cancelled: {reason}"
+
 async def tts_exception_handler(request: Request, exc: TTSError):
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -43,4 +59,24 @@ async def project_not_found_handler(request: Request, exc: ProjectNotFoundError)
     return JSONResponse(
         status_code=status.HTTP_404_NOT_FOUND,
         content={"status": "error", "message": exc.message},
+    )
+
+async def job_not_found_handler(request: Request, exc: JobNotFoundError):
+    return JSONResponse(
+        status_code=status.HTTP_404_NOT_FOUND,
+        content={"status": "error", "message": exc.message},
+    )
+
+async def project_busy_handler(request: Request, exc: ProjectBusyError):
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"status": "error", "message": exc.message},
+    )
+
+async def request_cancelled_handler(request: Request, exc: RequestCancelledError):
+    # 超过截止时间返回504，客户端断开或主动取消时使用非标准的499
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT if exc.reason == "deadline" else 499
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": "error", "message": exc.message},
     )
\ No newline at end of file
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """
+    进程内的简单指标registry，以Prometheus文本格式输出
+
+    多进程部署(多个uvicorn worker或合成worker)时每个进程各自计数；API进程通过 /metrics 输出，
+    合成worker进程通过 start_metrics_server 启动的独立端口输出
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, Tuple[int, float]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        """登记指标说明"""
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0):
+        """计数器累加"""
+        key = self._label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        """设置瞬时值"""
+        key = self._label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        """记录一次观测值，输出次数和总和"""
+        key = self._label_key(labels)
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            count, total = series.get(key, (0, 0.0))
+            series[key] = (count + 1, total + value)
+
+    def get(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        """读取计数器或瞬时值的当前值"""
+        key = self._label_key(labels)
+        with self._lock:
+            if name in self._gauges:
+                return self._gauges[name].get(key, 0.0)
+            return self._counters.get(name, {}).get(key, 0.0)
+
+    def render(self) -> str:
+        """输出Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            for metric_type, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    self._render_header(lines, name, metric_type)
+                    for key, value in sorted(series.items()):
+                        lines.append(f"{name}{self._format_labels(key)} {value}")
+            for name, series in sorted(self._summaries.items()):
+                self._render_header(lines, name, "summary")
+                for key, (count, total) in sorted(series.items()):
+                    lines.append(f"{name}_count{self._format_labels(key)} {count}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {total}")
+        return "\n".join(lines) + "\n"
+
+    def _render_header(self, lines, name: str, metric_type: str):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    @staticmethod
+    def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+        return tuple(sorted((labels or {}).items()))
+
+    @staticmethod
+    def _format_labels(key: LabelKey) -> str:
+        if not key:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    """
+    启动只提供 GET /metrics 的最小HTTP服务，供没有Web框架的进程(合成worker)输出指标
+
+    参数:
+        host: 监听地址
+        port: 监听端口，为0时由系统分配
+
+    返回:
+        已开始监听的服务
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", metrics.render()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "Not Found\n"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+metrics = Metrics()
+metrics.describe("tts_cancellations_total", "Synthesis requests cancelled, by reason")
+metrics.describe("tts_killed_processes_total", "Running Spark-TTS processes killed after cancellation")
+metrics.describe("tts_skipped_sentences_total", "Queued sentences skipped after cancellation")
@@ -0,0 +1,69 @@
+"""
+动态批量的吞吐对比
+
+使用桩批量worker模拟推理耗时，分别以逐句生成(批大小1)和动态批量提交同样的并发句子，
+输出两者的耗时与吞吐:
+
+    python -m app.inference.batch_benchmark --requests 32 --max_batch_size 8
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+from app.services.batch_scheduler import BatchScheduler
+from app.core.metrics import metrics
+
+STUB_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_batch_worker.py")
+
+
+async def run(requests: int, text: str, max_batch_size: int, max_wait_ms: float, worker_args) -> float:
+    """并发提交 requests 个句子，返回全部完成的耗时(秒)"""
+    scheduler = BatchScheduler(
+        ([sys.executable, STUB_WORKER, *worker_args], None),
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        length_bucket=0
+    )
+    # 先启动worker，避免进程启动时间计入结果
+    await scheduler.start()
+    try:
+        started = time.monotonic()
+        await asyncio.gather(*(scheduler.submit(f"{text} {index}") for index in range(requests)))
+        return time.monotonic() - started
+    finally:
+        await scheduler.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sequential and dynamically batched synthesis throughput")
+    parser.add_argument("--requests", type=int, default=32, help="并发提交的句子数")
+    parser.add_argument("--text", default="今天天气很好，我们一起去公园散步吧", help="句子内容")
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument("--max_wait_ms", type=float, default=20.0)
+    parser.add_argument("--overhead_ms", type=float, default=50)
+    parser.add_argument("--ms_per_char", type=float, default=5)
+    parser.add_argument("--batch_cost", type=float, default=0.05)
+    args = parser.parse_args()
+
+    worker_args = [
+        "--overhead_ms", str(args.overhead_ms),
+        "--ms_per_char", str(args.ms_per_char),
+        "--batch_cost", str(args.batch_cost),
+    ]
+    results = []
+    for label, max_batch_size in (("sequential", 1), ("batched", args.max_batch_size)):
+        batches_before = metrics.get("tts_batches_total")
+        elapsed = asyncio.run(run(args.requests, args.text, max_batch_size, args.max_wait_ms, worker_args))
+        batches = metrics.get("tts_batches_total") - batches_before
+        results.append(elapsed)
+        print(f"{label:<11} max_batch_size={max_batch_size:<3} batches={int(batches):<4} "
+              f"elapsed={elapsed:.2f}s throughput={args.requests / elapsed:.1f} sentences/s")
+
+    print(f"speedup: {results[0] / results[1]:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+服务端与推理worker之间的流式音频协议
+
+worker 通过标准输出写入一系列二进制帧，每帧格式为:
+
+    类型(1字节) | 序号(4字节, 大端) | 负载长度(4字节, 大端) | 负载
+
+帧类型:
+    START  负载为JSON格式的音频参数 {"sample_rate", "channels", "sample_width"}
+    CHUNK  负载为一段PCM音频(小端有符号整数)
+    END    当前文本(utterance)的音频已全部输出，负载为空
+    ERROR  生成过程中出错，负载为UTF-8编码的错误信息
+
+流式推理worker常驻运行，服务端通过标准输入逐个发送请求:
+    REQUEST 负载为JSON格式的文本 {"text", "prompt_speech_path", "prompt_text"}
+worker 依次返回 START、若干 CHUNK 和 END，出错时返回 ERROR，之后继续等待下一个请求。
+
+批量推理时worker同样常驻运行，服务端通过标准输入发送请求:
+    BATCH  负载为JSON格式的一批文本 [{"id", "text", "prompt_speech_path", "prompt_text"}, ...]
+worker 对批次中的每个文本依次返回一个 RESULT 帧，整批失败时返回一个 ERROR 帧:
+    RESULT 负载为 JSON头长度(4字节, 大端) | JSON头 | PCM音频，
+           JSON头包含 "id" 和音频参数，单个文本失败时包含 "error" 且没有音频
+
+序号从0开始逐帧递增(每个方向各自计数)，读取端据此检测丢帧。
+本模块只依赖标准库，worker 脚本在 Spark-TTS 的虚拟环境中也能直接导入。
+"""
+import json
+import struct
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+FRAME_START = 1
+FRAME_CHUNK = 2
+FRAME_END = 3
+FRAME_ERROR = 4
+FRAME_BATCH = 5
+FRAME_RESULT = 6
+FRAME_REQUEST = 7
+FRAME_TYPES = (FRAME_START, FRAME_CHUNK, FRAME_END, FRAME_ERROR, FRAME_BATCH, FRAME_RESULT, FRAME_REQUEST)
+
+HEADER = struct.Struct(">BII")
+RESULT_HEADER_LENGTH = struct.Struct(">I")
+# 单帧负载的上限，防止读取端因损坏的数据分配过大内存
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """流式协议数据不合法"""
+
+
+def encode_frame(frame_type: int, seq: int, payload: bytes = b"") -> bytes:
+    """编码单个帧"""
+    return HEADER.pack(frame_type, seq, len(payload)) + payload
+
+
+class FrameWriter:
+    def __init__(self, out: BinaryIO):
+        """worker 端的帧写入器，自动维护序号"""
+        self.out = out
+        self.seq = 0
+
+    def _write(self, frame_type: int, payload: bytes = b""):
+        self.out.write(encode_frame(frame_type, self.seq, payload))
+        self.out.flush()
+        self.seq += 1
+
+    def start(self, sample_rate: int, channels: int = 1, sample_width: int = 2):
+        """写入音频参数"""
+        self._write(FRAME_START, json.dumps({
+            "sample_rate": sample_rate,
+            "channels": channels,
+            "sample_width": sample_width,
+        }).encode("utf-8"))
+
+    def chunk(self, pcm: bytes):
+        """写入一段PCM音频"""
+        if pcm:
+            self._write(FRAME_CHUNK, pcm)
+
+    def end(self):
+        """写入结束标记"""
+        self._write(FRAME_END)
+
+    def error(self, message: str):
+        """写入错误信息"""
+        self._write(FRAME_ERROR, message.encode("utf-8"))
+
+    def request(self, text: str, prompt_speech_path: Optional[str] = None, prompt_text: Optional[str] = None):
+        """写入一个流式合成请求"""
+        self._write(FRAME_REQUEST, json.dumps({
+            "text": text,
+            "prompt_speech_path": prompt_speech_path,
+            "prompt_text": prompt_text,
+        }, ensure_ascii=False).encode("utf-8"))
+
+    def batch(self, items: List[Dict[str, Any]]):
+        """写入一批待合成的文本"""
+        self._write(FRAME_BATCH, json.dumps(items, ensure_ascii=False).encode("utf-8"))
+
+    def result(self, header: Dict[str, Any], pcm: bytes = b""):
+        """写入批次中单个文本的合成结果"""
+        self._write(FRAME_RESULT, encode_result(header, pcm))
+
+
+class StreamWriterAdapter:
+    """把 asyncio.StreamWriter 适配为 FrameWriter 使用的二进制文件接口，刷新由调用方 drain 完成"""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data: bytes):
+        self.writer.write(data)
+
+    def flush(self):
+        pass
+
+
+def encode_result(header: Dict[str, Any], pcm: bytes = b"") -> bytes:
+    """编码 RESULT 帧负载"""
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    return RESULT_HEADER_LENGTH.pack(len(header_bytes)) + header_bytes + pcm
+
+
+def decode_result(payload: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """解析 RESULT 帧负载，返回 (JSON头, PCM音频)"""
+    try:
+        (header_length,) = RESULT_HEADER_LENGTH.unpack_from(payload)
+        start = RESULT_HEADER_LENGTH.size
+        header = json.loads(payload[start:start + header_length].decode("utf-8"))
+        return header, payload[start + header_length:]
+    except (struct.error, ValueError):
+        raise ProtocolError("Invalid RESULT frame payload")
+
+
+def _unpack_header(header: bytes) -> Tuple[int, int, int]:
+    frame_type, seq, length = HEADER.unpack(header)
+    if frame_type not in FRAME_TYPES:
+        raise ProtocolError(f"Unknown frame type: {frame_type}")
+    if length > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Frame payload too large: {length}")
+    return frame_type, seq, length
+
+
+def read_frame_sync(stream: BinaryIO) -> Optional[Tuple[int, int, bytes]]:
+    """从阻塞的二进制流读取一个帧，供 worker 端读取标准输入使用"""
+    header = stream.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ProtocolError("Truncated frame header")
+    frame_type, seq, length = _unpack_header(header)
+    payload = stream.read(length) if length else b""
+    if len(payload) < length:
+        raise ProtocolError("Truncated frame payload")
+    return frame_type, seq, payload
+
+
+async def read_frame(reader) -> Optional[Tuple[int, int, bytes]]:
+    """
+    从 asyncio.StreamReader 读取一个帧
+
+    返回:
+        (帧类型, 序号, 负载)，数据流正常结束时返回 None
+    """
+    import asyncio
+
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ProtocolError("Truncated frame header")
+
+    frame_type, seq, length = _unpack_header(header)
+
+    try:
+        payload = await reader.readexactly(length) if length else b""
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("Truncated frame payload")
+    return frame_type, seq, payload
+
+
+def parse_start_payload(payload: bytes) -> Dict[str, Any]:
+    """解析 START 帧中的音频参数"""
+    try:
+        params = json.loads(payload.decode("utf-8"))
+        return {
+            "sample_rate": int(params["sample_rate"]),
+            "channels": int(params.get("channels", 1)),
+            "sample_width": int(params.get("sample_width", 2)),
+        }
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ProtocolError("Invalid START frame payload")
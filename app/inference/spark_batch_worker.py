@@ -0,0 +1,119 @@
+"""
+Spark-TTS 批量推理worker
+
+在 Spark-TTS 根目录下使用其虚拟环境常驻运行，模型只加载一次。
+从标准输入读取 BATCH 帧，对批次中的文本做一次批量生成，再为每个文本返回 RESULT 帧:
+
+    cd $SPARK_TTS_ROOT_DIR && .venv/bin/python /path/to/app/inference/spark_batch_worker.py \\
+        --device 0 --model_dir pretrained_models/Spark-TTS-0.5B
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+from protocol import FrameWriter, read_frame_sync, FRAME_BATCH
+
+# 以 Spark-TTS 根目录为工作目录运行，使 cli 模块可以导入
+sys.path.insert(0, os.getcwd())
+
+SEMANTIC_TOKEN_PATTERN = re.compile(r"bicodec_semantic_(\d+)")
+
+
+def get_device(device_id: str):
+    import torch
+
+    if torch.cuda.is_available():
+        return torch.device(f"cuda:{device_id}")
+    if torch.backends.mps.is_available():
+        return torch.device(f"mps:{device_id}")
+    return torch.device("cpu")
+
+
+def to_pcm16(wav) -> bytes:
+    import numpy as np
+
+    samples = np.clip(np.asarray(wav, dtype=np.float32), -1.0, 1.0)
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+def batch_inference(model, writer: FrameWriter, items):
+    import torch
+
+    # 每个文本的提示语音可能不同，逐个构建提示词和全局token
+    prompts = []
+    global_tokens = []
+    for item in items:
+        prompt, global_token_ids = model.process_prompt(
+            item["text"], item.get("prompt_speech_path"), item.get("prompt_text")
+        )
+        prompts.append(prompt)
+        global_tokens.append(global_token_ids)
+
+    # 仅解码器模型批量生成时需要左侧填充
+    model.tokenizer.padding_side = "left"
+    if model.tokenizer.pad_token is None:
+        model.tokenizer.pad_token = model.tokenizer.eos_token
+    model_inputs = model.tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+
+    with torch.no_grad():
+        generated_ids = model.model.generate(
+            **model_inputs,
+            max_new_tokens=3000,
+            do_sample=True,
+            top_k=50,
+            top_p=0.95,
+            temperature=0.8,
+            pad_token_id=model.tokenizer.pad_token_id,
+        )
+    generated_ids = generated_ids[:, model_inputs.input_ids.shape[1]:]
+    predicts = model.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+
+    for item, predict, global_token_ids in zip(items, predicts, global_tokens):
+        header = {"id": item["id"], "sample_rate": model.sample_rate, "channels": 1, "sample_width": 2}
+        try:
+            semantic_ids = [int(token) for token in SEMANTIC_TOKEN_PATTERN.findall(predict)]
+            if not semantic_ids:
+                raise ValueError("No semantic tokens generated")
+            with torch.no_grad():
+                wav = model.audio_tokenizer.detokenize(
+                    global_token_ids.to(model.device).squeeze(0),
+                    torch.tensor(semantic_ids).long().unsqueeze(0).to(model.device),
+                )
+            writer.result(header, to_pcm16(wav))
+        except Exception as e:
+            writer.result({**header, "error": f"{type(e).__name__}: {e}"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spark-TTS batching worker")
+    parser.add_argument("--device", default="0")
+    parser.add_argument("--model_dir", required=True)
+    args = parser.parse_args()
+
+    # 协议帧使用原标准输出，模型加载等过程中的打印输出重定向到标准错误
+    frame_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    writer = FrameWriter(frame_out)
+
+    from cli.SparkTTS import SparkTTS
+
+    model = SparkTTS(args.model_dir, get_device(args.device))
+
+    while True:
+        frame = read_frame_sync(sys.stdin.buffer)
+        if frame is None:
+            return 0
+        frame_type, _, payload = frame
+        if frame_type != FRAME_BATCH:
+            writer.error(f"Unexpected frame type: {frame_type}")
+            continue
+        try:
+            batch_inference(model, writer, json.loads(payload.decode("utf-8")))
+        except Exception as e:
+            writer.error(f"{type(e).__name__}: {e}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
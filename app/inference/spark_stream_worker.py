@@ -0,0 +1,160 @@
+"""
+Spark-TTS 流式推理worker
+
+在 Spark-TTS 根目录下使用其虚拟环境常驻运行，模型只加载一次。从标准输入逐个读取 REQUEST 帧，
+边生成语义token边解码音频，按 protocol 模块定义的帧格式把音频块写到标准输出:
+
+    cd $SPARK_TTS_ROOT_DIR && .venv/bin/python /path/to/app/inference/spark_stream_worker.py \\
+        --device 0 --model_dir pretrained_models/Spark-TTS-0.5B
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+
+from protocol import FrameWriter, read_frame_sync, FRAME_REQUEST
+
+# 以 Spark-TTS 根目录为工作目录运行，使 cli 模块可以导入
+sys.path.insert(0, os.getcwd())
+
+SEMANTIC_TOKEN_PATTERN = re.compile(r"bicodec_semantic_(\d+)")
+# 后面已跟随其他字符的token才是完整的，避免把被流式输出截断的数字当作token
+COMPLETE_TOKEN_PATTERN = re.compile(r"bicodec_semantic_(\d+)(?=\D)")
+# BiCodec 每个语义token对应的采样点数 (16kHz, 50 token/s)
+SAMPLES_PER_TOKEN = 320
+# 尾部保留的token数，解码结果在后续token到达后才稳定
+LOOKAHEAD_TOKENS = 4
+# 每次解码时保留的已输出token数，作为解码器的左侧上下文，使相邻窗口的音频衔接平滑
+LEFT_CONTEXT_TOKENS = 50
+
+
+def get_device(device_id: str):
+    import torch
+
+    if torch.cuda.is_available():
+        return torch.device(f"cuda:{device_id}")
+    if torch.backends.mps.is_available():
+        return torch.device(f"mps:{device_id}")
+    return torch.device("cpu")
+
+
+def to_pcm16(wav) -> bytes:
+    import numpy as np
+
+    samples = np.clip(np.asarray(wav, dtype=np.float32), -1.0, 1.0)
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+def stream_inference(model, writer: FrameWriter, request, chunk_tokens: int):
+    import torch
+    from transformers import TextIteratorStreamer
+
+    prompt, global_token_ids = model.process_prompt(
+        request["text"], request.get("prompt_speech_path"), request.get("prompt_text")
+    )
+    model_inputs = model.tokenizer([prompt], return_tensors="pt").to(model.device)
+    streamer = TextIteratorStreamer(model.tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    generation_error = []
+
+    def generate():
+        try:
+            with torch.no_grad():
+                model.model.generate(
+                    **model_inputs,
+                    max_new_tokens=3000,
+                    do_sample=True,
+                    top_k=50,
+                    top_p=0.95,
+                    temperature=0.8,
+                    streamer=streamer,
+                )
+        except Exception as e:
+            generation_error.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=generate, daemon=True)
+    thread.start()
+
+    writer.start(model.sample_rate)
+    global_tokens = global_token_ids.to(model.device).squeeze(0)
+    # 尚未解析的生成文本，只保留最后一个完整token之后的部分
+    pending_text = ""
+    semantic_ids = []
+    emitted_tokens = 0
+
+    def flush(final: bool):
+        """
+        解码滑动窗口并输出新稳定的音频
+
+        窗口由 LEFT_CONTEXT_TOKENS 个已输出的token、新token和尾部未稳定的token组成，
+        每次解码的长度与已生成的总长度无关，整段生成的解码开销是线性的
+        """
+        nonlocal emitted_tokens
+        stable_tokens = len(semantic_ids) if final else len(semantic_ids) - LOOKAHEAD_TOKENS
+        if stable_tokens <= emitted_tokens:
+            return
+        window_start = max(emitted_tokens - LEFT_CONTEXT_TOKENS, 0)
+        with torch.no_grad():
+            wav = model.audio_tokenizer.detokenize(
+                global_tokens,
+                torch.tensor(semantic_ids[window_start:]).long().unsqueeze(0).to(model.device),
+            )
+        begin = (emitted_tokens - window_start) * SAMPLES_PER_TOKEN
+        end = len(wav) if final else (stable_tokens - window_start) * SAMPLES_PER_TOKEN
+        if end > begin:
+            writer.chunk(to_pcm16(wav[begin:end]))
+        emitted_tokens = stable_tokens
+
+    for text in streamer:
+        pending_text += text
+        consumed = 0
+        for match in COMPLETE_TOKEN_PATTERN.finditer(pending_text):
+            semantic_ids.append(int(match.group(1)))
+            consumed = match.end()
+        pending_text = pending_text[consumed:]
+        if len(semantic_ids) - emitted_tokens - LOOKAHEAD_TOKENS >= chunk_tokens:
+            flush(final=False)
+
+    thread.join()
+    if generation_error:
+        raise generation_error[0]
+    semantic_ids.extend(int(token) for token in SEMANTIC_TOKEN_PATTERN.findall(pending_text))
+    flush(final=True)
+    writer.end()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spark-TTS streaming worker")
+    parser.add_argument("--device", default="0")
+    parser.add_argument("--model_dir", required=True)
+    parser.add_argument("--chunk_tokens", type=int, default=25, help="每累计多少个语义token解码输出一次")
+    args = parser.parse_args()
+
+    # 协议帧使用原标准输出，模型加载等过程中的打印输出重定向到标准错误
+    frame_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    writer = FrameWriter(frame_out)
+
+    from cli.SparkTTS import SparkTTS
+
+    model = SparkTTS(args.model_dir, get_device(args.device))
+
+    while True:
+        frame = read_frame_sync(sys.stdin.buffer)
+        if frame is None:
+            return 0
+        frame_type, _, payload = frame
+        if frame_type != FRAME_REQUEST:
+            writer.error(f"Unexpected frame type: {frame_type}")
+            continue
+        try:
+            stream_inference(model, writer, json.loads(payload.decode("utf-8")), args.chunk_tokens)
+        except Exception as e:
+            writer.error(f"{type(e).__name__}: {e}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+批量推理协议的桩worker，不加载模型，用于验证批量调度逻辑及演示批量带来的吞吐提升
+
+常驻运行，从标准输入读取 BATCH 帧，模拟一次批量生成的耗时后为每个文本返回 RESULT 帧。
+自回归生成的每一步主要受显存带宽限制，耗时与批大小关系不大，因此模拟耗时取决于批次中
+最长的文本，每增加一个文本只增加少量开销:
+
+    耗时 = overhead_ms + ms_per_char * 最长文本长度 * (1 + batch_cost * (批大小 - 1))
+"""
+import argparse
+import json
+import math
+import struct
+import sys
+import time
+
+from protocol import FrameWriter, read_frame_sync, FRAME_BATCH
+
+SAMPLE_RATE = 16000
+
+
+def synthesize_tone(text: str, ms_per_char: int) -> bytes:
+    count = len(text) * ms_per_char * SAMPLE_RATE // 1000
+    samples = (int(8000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)) for i in range(count))
+    return struct.pack(f"<{count}h", *samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub batching TTS worker")
+    parser.add_argument("--overhead_ms", type=float, default=50, help="每次生成的固定开销(毫秒)")
+    parser.add_argument("--ms_per_char", type=float, default=5, help="每个字符的生成耗时(毫秒)")
+    parser.add_argument("--batch_cost", type=float, default=0.05, help="批次中每增加一个文本增加的相对耗时")
+    parser.add_argument("--audio_ms_per_char", type=int, default=150, help="每个字符对应的音频时长(毫秒)")
+    # 与真实worker保持一致的参数，桩worker忽略
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--model_dir", default=None)
+    args, _ = parser.parse_known_args()
+
+    writer = FrameWriter(sys.stdout.buffer)
+    while True:
+        frame = read_frame_sync(sys.stdin.buffer)
+        if frame is None:
+            return 0
+        frame_type, _, payload = frame
+        if frame_type != FRAME_BATCH:
+            writer.error(f"Unexpected frame type: {frame_type}")
+            continue
+
+        items = json.loads(payload.decode("utf-8"))
+        longest = max((len(item["text"]) for item in items), default=0)
+        elapsed_ms = args.overhead_ms + args.ms_per_char * longest * (1 + args.batch_cost * (len(items) - 1))
+        time.sleep(elapsed_ms / 1000)
+
+        for item in items:
+            header = {"id": item["id"], "sample_rate": SAMPLE_RATE, "channels": 1, "sample_width": 2}
+            writer.result(header, synthesize_tone(item["text"], args.audio_ms_per_char))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
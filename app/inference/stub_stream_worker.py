@@ -0,0 +1,73 @@
+"""
+流式协议的桩worker，不加载模型，按文本长度生成正弦波音频
+
+与真实worker一样常驻运行，从标准输入读取 REQUEST 帧，逐个返回音频帧，
+用于在没有GPU和Spark-TTS环境时验证流式协议及服务端处理逻辑。
+服务端通过 STREAM_STUB_WORKER_ARGS 配置传入 --delay、--fail_after 等参数，对每个请求生效。
+"""
+import argparse
+import json
+import math
+import struct
+import sys
+import time
+
+from protocol import FrameWriter, read_frame_sync, FRAME_REQUEST
+
+SAMPLE_RATE = 16000
+
+
+def stream_tone(writer: FrameWriter, text: str, args):
+    writer.start(SAMPLE_RATE)
+
+    total_samples = len(text) * args.ms_per_char * SAMPLE_RATE // 1000
+    chunk_samples = args.chunk_ms * SAMPLE_RATE // 1000
+    emitted = 0
+    chunk_count = 0
+    while emitted < total_samples:
+        if chunk_count == args.fail_after:
+            writer.error(f"Stub worker failed after {chunk_count} chunks")
+            return
+        if chunk_count == args.skip_seq_after:
+            writer.seq += 1
+        count = min(chunk_samples, total_samples - emitted)
+        samples = (
+            int(8000 * math.sin(2 * math.pi * 440 * (emitted + i) / SAMPLE_RATE))
+            for i in range(count)
+        )
+        writer.chunk(struct.pack(f"<{count}h", *samples))
+        emitted += count
+        chunk_count += 1
+        if args.delay:
+            time.sleep(args.delay)
+
+    writer.end()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub streaming TTS worker")
+    parser.add_argument("--chunk_ms", type=int, default=200, help="每个音频块的时长(毫秒)")
+    parser.add_argument("--ms_per_char", type=int, default=150, help="每个字符对应的音频时长(毫秒)")
+    parser.add_argument("--delay", type=float, default=0.0, help="每个音频块之间的等待时间(秒)，模拟生成耗时")
+    parser.add_argument("--fail_after", type=int, default=-1, help="输出指定数量的音频块后报错，-1表示不报错")
+    parser.add_argument("--skip_seq_after", type=int, default=-1, help="输出指定数量的音频块后跳过一个序号，模拟丢帧")
+    # 与真实worker保持一致的参数，桩worker忽略
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--model_dir", default=None)
+    parser.add_argument("--chunk_tokens", default=None)
+    args, _ = parser.parse_known_args()
+
+    writer = FrameWriter(sys.stdout.buffer)
+    while True:
+        frame = read_frame_sync(sys.stdin.buffer)
+        if frame is None:
+            return 0
+        frame_type, _, payload = frame
+        if frame_type != FRAME_REQUEST:
+            writer.error(f"Unexpected frame type: {frame_type}")
+            continue
+        stream_tone(writer, json.loads(payload.decode("utf-8"))["text"], args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,51 @@
 from fastapi import FastAPI, UploadFile, HTTPException, status, Depends, Form, File, Request
-from fastapi.responses import StreamingResponse, Response, RedirectResponse
+from fastapi.responses import StreamingResponse, Response, RedirectResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Callable
+from contextlib import asynccontextmanager
 import uuid
 import os
+import socket
+import time
+import asyncio
 from pathlib import Path
 import logging
 
 # Import core modules
 from app.core.config import get_settings
 from app.core.security import get_api_key
+from app.core.metrics import metrics
+from app.core.cancellation import (
+    CancellationToken,
+    watch_disconnect,
+    CANCEL_CLIENT,
+    CANCEL_DISCONNECT,
+    CANCEL_LEASE_LOST
+)
 from app.core.exceptions import (
     TTSError,
     FileProcessingError,
     ValidationError,
     ProjectNotFoundError,
+    JobNotFoundError,
+    ProjectBusyError,
+    RequestCancelledError,
     tts_exception_handler,
     file_processing_handler,
     validation_handler,
-    project_not_found_handler
+    project_not_found_handler,
+    job_not_found_handler,
+    project_busy_handler,
+    request_cancelled_handler
 )
 
 # Import models
 from app.models.request import SynthesizeRequest, PromptSpeechFile
 from app.models.response import (
     SynthesizeResponse,
+    ResynthesizeResponse,
+    JobStatusResponse,
     ProjectFilesResponse,
     ErrorResponse
 )
@@ -34,10 +55,20 @@ from app.services.tts_service import TTSService
 from app.services.audio_processor import AudioProcessor
 from app.services.file_manager import FileManager
 from app.services.stream_service import StreamService
+from app.services.job_broker import get_job_broker, JOB_CANCELLED
 
 # Import routers
 from app.routers import audio
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """随应用启动和停止常驻的推理worker"""
+    await tts_service.start()
+    try:
+        yield
+    finally:
+        await tts_service.close()
+
 # Initialize FastAPI app with metadata
 app = FastAPI(
     title="Spark-TTS API Server",
@@ -49,7 +80,8 @@ app = FastAPI(
     },
     license_info={
         "name": "MIT",
-    }
+    },
+    lifespan=lifespan
 )
 
 # Register exception handlers
@@ -57,13 +89,22 @@ app.add_exception_handler(TTSError, tts_exception_handler)
 app.add_exception_handler(FileProcessingError, file_processing_handler)
 app.add_exception_handler(ValidationError, validation_handler)
 app.add_exception_handler(ProjectNotFoundError, project_not_found_handler)
+app.add_exception_handler(JobNotFoundError, job_not_found_handler)
+app.add_exception_handler(ProjectBusyError, project_busy_handler)
+app.add_exception_handler(RequestCancelledError, request_cancelled_handler)
 
 # Initialize services
 settings = get_settings()
-tts_service = TTSService()
+# 启用任务队列时合成在 worker 进程中执行，动态批量只在 worker 中启用，API进程不加载批量推理模型
+tts_service = TTSService(enable_batching=settings.BATCHING_ENABLED and not settings.JOB_BROKER_ENABLED)
 audio_processor = AudioProcessor()
 file_manager = FileManager()
 stream_service = StreamService()
+rendition_cache = audio.rendition_cache
+# 启用任务队列时，合成由独立的 worker 进程 (python -m app.worker) 执行
+job_broker = get_job_broker() if settings.JOB_BROKER_ENABLED else None
+# 流式合成在API进程中执行，占用项目时以此标识持有者
+stream_holder_id = f"api-{socket.gethostname()}-{os.getpid()}"
 
 # 添加logger定义
 logger = logging.getLogger(__name__)
@@ -82,33 +123,11 @@ async def root():
     """将根路径重定向到播放器页面"""
     return RedirectResponse(url="static/player.html")
 
-@app.post("/synthesize", response_model=SynthesizeResponse)
-async def synthesize(
-    # Parameters are now expected as Form fields
-    text: str = Form(...),
-    project_id: Optional[str] = Form(None),
-    output_format: str = Form("wav"),
-    prompt_text: Optional[str] = Form(None),
-    split_sentences: bool = Form(False),
-    prompt_speech: Optional[UploadFile] = File(None), # Explicitly use File for clarity
-    api_key: str = Depends(get_api_key)
-):
-    """
-    接收文本和可选参数（通过 multipart/form-data），生成语音文件并将其关联到指定或新生成的 project_id
-
-    - **text**: 要合成的文本 (Form field)
-    - **project_id**: (可选) 项目ID (Form field)
-    - **prompt_speech**: (可选) 提示语音文件 (File upload)
-    - **prompt_text**: (可选) 提示文本 (Form field)
-    - **output_format**: (可选) 输出格式，默认为 wav (Form field)
-    - **split_sentences**: (可选) 是否按句分割，默认为 false (Form field)
-    """
-    # 验证请求参数 (using the 'text' variable directly)
-    if not text:
-        # The previous print statements for 'request' are no longer valid
-        raise ValidationError("Text is required")
-
-    # 处理提示语音文件
+async def save_prompt_speech(
+    prompt_speech: Optional[UploadFile],
+    prompt_text: Optional[str]
+) -> Optional[str]:
+    """验证上传的提示语音文件并保存到临时位置，返回临时文件路径"""
     prompt_speech_path = None
     if prompt_speech:
         # 验证提示语音文件大小
@@ -129,7 +148,8 @@ async def synthesize(
         temp_dir.mkdir(parents=True, exist_ok=True)
         # Ensure filename is unique and has a standard extension (e.g., .wav)
         # Use prompt_speech.filename if available and sanitize, otherwise generate UUID
-        original_filename = prompt_speech.filename if prompt_speech.filename else f"prompt_{uuid.uuid4()}"
+        original_filename = prompt_speech.filename if prompt_speech.filename else "prompt"
+        original_filename = f"{uuid.uuid4().hex[:8]}_{original_filename}"
         # Basic sanitization (replace spaces, limit length, etc.) - adjust as needed
         safe_filename = "".join(c if c.isalnum() or c in ('-', '_', '.') else '_' for c in original_filename)[:100]
         # Ensure a reasonable extension, default to .wav if unknown
@@ -142,36 +162,160 @@ async def synthesize(
         with open(prompt_speech_path, "wb") as f:
             f.write(await prompt_speech.read())
 
+    return prompt_speech_path
+
+def get_request_timeout(request: Request, timeout: Optional[float]) -> Optional[float]:
+    """
+    获取客户端指定的超时时间(秒)，优先使用表单字段 timeout，其次请求头 X-Request-Timeout，
+    都未提供时返回 None，不大于0表示不设截止时间
+    """
+    if timeout is not None:
+        return timeout
+    header_timeout = request.headers.get("X-Request-Timeout")
+    if header_timeout:
+        try:
+            return float(header_timeout)
+        except ValueError:
+            raise ValidationError(f"Invalid X-Request-Timeout header: {header_timeout}")
+    return None
+
+def create_cancel_token(timeout: Optional[float]) -> CancellationToken:
+    """为同步等待结果的请求创建取消标记，客户端未指定超时时使用 REQUEST_TIMEOUT_SECONDS"""
+    return CancellationToken(settings.REQUEST_TIMEOUT_SECONDS if timeout is None else timeout)
+
+async def enqueue_job(kind: str, payload: dict, prompt_speech_path: Optional[str], timeout: Optional[float]) -> str:
+    """提交任务到任务队列，提示语音文件交由 worker 在任务结束后清理"""
+    # 任务提交后请求立即返回，只有客户端显式指定超时时才设置截止时间，
+    # 截止时间以绝对时间随任务提交，worker 据此跳过或终止过期的任务
+    deadline = time.time() + timeout if timeout is not None and timeout > 0 else None
     try:
-        # 处理文本分割 (using direct variables)
-        if split_sentences:
-            from app.utils.text_splitter import split_text_into_sentences
-            sentences = split_text_into_sentences(text)
+        return await run_in_threadpool(job_broker.enqueue, kind, {
+            **payload,
+            "prompt_speech_path": prompt_speech_path,
+            "deadline": deadline
+        })
+    except Exception:
+        if prompt_speech_path and os.path.exists(prompt_speech_path):
+            os.remove(prompt_speech_path)
+        raise
 
-            # 合成多个句子 (using direct variables)
-            project_id_res, output_files = await tts_service.synthesize_multiple(
-                sentences,
-                project_id, # Use project_id variable
-                prompt_speech_path,
-                prompt_text, # Use prompt_text variable
-                output_format # Use output_format variable
-            )
-            # Ensure project_id is updated if a new one was generated
-            if project_id_res:
-                 project_id = project_id_res
-        else:
-            # 合成单个文本 (using direct variables)
-            project_id_res, _ = await tts_service.synthesize(
-                text, # Use text variable
-                project_id, # Use project_id variable
-                prompt_speech_path,
-                prompt_text, # Use prompt_text variable
-                output_format, # Use output_format variable
-                split_sentences # Use split_sentences variable
-            )
-            # Ensure project_id is updated if a new one was generated
-            if project_id_res:
-                 project_id = project_id_res
+async def hold_project_for_stream(project_id: str, cancel_token: CancellationToken) -> Callable[[], None]:
+    """
+    启用任务队列时，流式合成期间通过任务队列占用项目，worker 不会同时执行该项目的任务，
+    两者不会分配相同的片段序号；项目已有任务正在执行时抛出 ProjectBusyError
+
+    返回:
+        释放占用的函数，同步调用，客户端断开后也能执行
+    """
+    if job_broker is None:
+        return lambda: None
+    job_id = await run_in_threadpool(job_broker.hold_project, project_id, stream_holder_id, "stream")
+    if job_id is None:
+        raise ProjectBusyError(project_id)
+
+    async def keep_alive():
+        lease_interval = max(settings.JOB_VISIBILITY_TIMEOUT / 3, 1.0)
+        while True:
+            await asyncio.sleep(lease_interval)
+            if not await run_in_threadpool(job_broker.extend_lease, job_id, stream_holder_id):
+                # 占用已过期，worker 可能已开始处理该项目
+                cancel_token.cancel(CANCEL_LEASE_LOST)
+                return
+
+    heartbeat = asyncio.create_task(keep_alive())
+
+    def release():
+        heartbeat.cancel()
+        # 提交到线程池但不等待，请求被取消后之后的 await 都会失败
+        asyncio.get_running_loop().run_in_executor(None, job_broker.complete, job_id, stream_holder_id, None)
+
+    return release
+
+@app.post("/synthesize", response_model=SynthesizeResponse)
+async def synthesize(
+    request: Request,
+    # Parameters are now expected as Form fields
+    text: str = Form(...),
+    project_id: Optional[str] = Form(None),
+    output_format: str = Form("wav"),
+    prompt_text: Optional[str] = Form(None),
+    split_sentences: bool = Form(False),
+    timeout: Optional[float] = Form(None),
+    prompt_speech: Optional[UploadFile] = File(None), # Explicitly use File for clarity
+    api_key: str = Depends(get_api_key)
+):
+    """
+    接收文本和可选参数（通过 multipart/form-data），生成语音文件并将其关联到指定或新生成的 project_id
+
+    - **text**: 要合成的文本 (Form field)
+    - **project_id**: (可选) 项目ID (Form field)
+    - **prompt_speech**: (可选) 提示语音文件 (File upload)
+    - **prompt_text**: (可选) 提示文本 (Form field)
+    - **output_format**: (可选) 输出格式，默认为 wav (Form field)
+    - **split_sentences**: (可选) 是否按句分割，默认为 false (Form field)
+    - **timeout**: (可选) 请求超时秒数，也可通过请求头 X-Request-Timeout 指定 (Form field)
+    """
+    # 验证请求参数 (using the 'text' variable directly)
+    if not text:
+        # The previous print statements for 'request' are no longer valid
+        raise ValidationError("Text is required")
+
+    timeout = get_request_timeout(request, timeout)
+
+    # 处理提示语音文件
+    prompt_speech_path = await save_prompt_speech(prompt_speech, prompt_text)
+
+    if job_broker:
+        project_id = project_id or str(uuid.uuid4())
+        job_id = await enqueue_job("synthesize", {
+            "text": text,
+            "project_id": project_id,
+            "prompt_text": prompt_text,
+            "output_format": output_format,
+            "split_sentences": split_sentences
+        }, prompt_speech_path, timeout)
+        return SynthesizeResponse(
+            status="queued",
+            project_id=project_id,
+            stream_url=f"/stream/{project_id}",
+            job_id=job_id
+        )
+
+    cancel_token = create_cancel_token(timeout)
+    try:
+        # 客户端断开连接或超过截止时间时终止合成，释放合成资源
+        async with watch_disconnect(request, cancel_token):
+            # 处理文本分割 (using direct variables)
+            if split_sentences:
+                from app.utils.text_splitter import split_text_into_sentences
+                sentences = split_text_into_sentences(text)
+
+                # 合成多个句子 (using direct variables)
+                project_id_res, output_files = await tts_service.synthesize_multiple(
+                    sentences,
+                    project_id, # Use project_id variable
+                    prompt_speech_path,
+                    prompt_text, # Use prompt_text variable
+                    output_format, # Use output_format variable
+                    cancel_token=cancel_token
+                )
+                # Ensure project_id is updated if a new one was generated
+                if project_id_res:
+                     project_id = project_id_res
+            else:
+                # 合成单个文本 (using direct variables)
+                project_id_res, _ = await tts_service.synthesize(
+                    text, # Use text variable
+                    project_id, # Use project_id variable
+                    prompt_speech_path,
+                    prompt_text, # Use prompt_text variable
+                    output_format, # Use output_format variable
+                    split_sentences, # Use split_sentences variable
+                    cancel_token=cancel_token
+                )
+                # Ensure project_id is updated if a new one was generated
+                if project_id_res:
+                     project_id = project_id_res
 
         # 构建响应
         return SynthesizeResponse(
@@ -185,25 +329,268 @@ async def synthesize(
         if prompt_speech_path and os.path.exists(prompt_speech_path):
             os.remove(prompt_speech_path)
 
+@app.post("/synthesize/stream")
+async def synthesize_stream(
+    request: Request,
+    text: str = Form(...),
+    project_id: Optional[str] = Form(None),
+    prompt_text: Optional[str] = Form(None),
+    timeout: Optional[float] = Form(None),
+    prompt_speech: Optional[UploadFile] = File(None),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    流式合成单个文本，生成过程中即返回音频(WAV)，生成结束后音频同时保存为项目片段
+
+    - **text**: 要合成的文本 (Form field)
+    - **project_id**: (可选) 项目ID (Form field)，通过响应头 X-Project-Id 返回
+    - **prompt_speech**: (可选) 提示语音文件 (File upload)
+    - **prompt_text**: (可选) 提示文本 (Form field)
+    - **timeout**: (可选) 请求超时秒数，也可通过请求头 X-Request-Timeout 指定 (Form field)
+    """
+    if not text:
+        raise ValidationError("Text is required")
+
+    cancel_token = create_cancel_token(get_request_timeout(request, timeout))
+    prompt_speech_path = await save_prompt_speech(prompt_speech, prompt_text)
+    project_id = project_id or str(uuid.uuid4())
+    try:
+        release_project = await hold_project_for_stream(project_id, cancel_token)
+    except BaseException:
+        if prompt_speech_path and os.path.exists(prompt_speech_path):
+            os.remove(prompt_speech_path)
+        raise
+
+    audio_stream = tts_service.synthesize_stream(
+        text,
+        project_id,
+        prompt_speech_path,
+        prompt_text,
+        cancel_token=cancel_token
+    )
+
+    try:
+        # 先读取WAV文件头，使worker启动阶段的错误仍能以正常的错误响应返回
+        async with watch_disconnect(request, cancel_token):
+            header = await audio_stream.__anext__()
+    except BaseException:
+        if prompt_speech_path and os.path.exists(prompt_speech_path):
+            os.remove(prompt_speech_path)
+        try:
+            await audio_stream.aclose()
+        finally:
+            release_project()
+        raise
+
+    async def stream_body():
+        try:
+            yield header
+            async for chunk in audio_stream:
+                yield chunk
+        except (TTSError, RequestCancelledError) as e:
+            # 响应头已发送，只能记录错误并中断连接
+            logger.error(f"Streaming synthesis failed for project {project_id}: {e.message}")
+            raise
+        except (GeneratorExit, asyncio.CancelledError):
+            # 客户端断开连接，关闭 audio_stream 时会终止推理worker
+            cancel_token.cancel(CANCEL_DISCONNECT)
+            raise
+        finally:
+            # 客户端断开时之后的 await 都会被取消，先删除临时文件再关闭 audio_stream
+            if prompt_speech_path and os.path.exists(prompt_speech_path):
+                os.remove(prompt_speech_path)
+            try:
+                await audio_stream.aclose()
+            finally:
+                # 片段文件已写入或清理后再释放项目
+                release_project()
+
+    return StreamingResponse(
+        stream_body(),
+        media_type="audio/wav",
+        headers={"X-Project-Id": project_id}
+    )
+
+@app.post("/projects/{project_id}/resynthesize", response_model=ResynthesizeResponse)
+async def resynthesize_project(
+    project_id: str,
+    request: Request,
+    text: str = Form(...),
+    output_format: str = Form("wav"),
+    prompt_text: Optional[str] = Form(None),
+    timeout: Optional[float] = Form(None),
+    prompt_speech: Optional[UploadFile] = File(None),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    接收修改后的完整文本，按句与项目中已有片段比对，只合成新增或修改的句子，并重新编号项目片段
+
+    - **project_id**: 项目ID
+    - **text**: 修改后的完整文本 (Form field)
+    - **prompt_speech**: (可选) 提示语音文件 (File upload)
+    - **prompt_text**: (可选) 提示文本 (Form field)
+    - **output_format**: (可选) 新合成片段的输出格式，默认为 wav (Form field)
+    - **timeout**: (可选) 请求超时秒数，也可通过请求头 X-Request-Timeout 指定 (Form field)
+    """
+    if not text:
+        raise ValidationError("Text is required")
+
+    timeout = get_request_timeout(request, timeout)
+
+    if not file_manager.get_project_files(project_id):
+        raise ProjectNotFoundError(project_id)
+
+    prompt_speech_path = await save_prompt_speech(prompt_speech, prompt_text)
+
+    if job_broker:
+        job_id = await enqueue_job("resynthesize", {
+            "text": text,
+            "project_id": project_id,
+            "prompt_text": prompt_text,
+            "output_format": output_format
+        }, prompt_speech_path, timeout)
+        return ResynthesizeResponse(
+            status="queued",
+            project_id=project_id,
+            stream_url=f"/stream/{project_id}",
+            job_id=job_id
+        )
+
+    cancel_token = create_cancel_token(timeout)
+    try:
+        from app.utils.text_splitter import split_text_into_sentences
+        sentences = split_text_into_sentences(text)
+
+        async with watch_disconnect(request, cancel_token):
+            stats = await tts_service.resynthesize(
+                sentences,
+                project_id,
+                prompt_speech_path,
+                prompt_text,
+                output_format,
+                cancel_token=cancel_token
+            )
+
+        return ResynthesizeResponse(
+            status="success",
+            project_id=project_id,
+            stream_url=f"/stream/{project_id}",
+            total_segments=stats["total"],
+            reused_segments=stats["reused"],
+            synthesized_segments=stats["synthesized"],
+            removed_segments=stats["removed"]
+        )
+
+    finally:
+        # 清理临时文件
+        if prompt_speech_path and os.path.exists(prompt_speech_path):
+            os.remove(prompt_speech_path)
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    """
+    查询合成任务的状态
+
+    - **job_id**: 任务ID
+    """
+    job = await run_in_threadpool(job_broker.get, job_id) if job_broker else None
+    if not job:
+        raise JobNotFoundError(job_id)
+    return job_status_response(job)
+
+def job_status_response(job: dict) -> JobStatusResponse:
+    """把任务记录转换为响应"""
+    return JobStatusResponse(
+        job_id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        attempts=job["attempts"],
+        max_attempts=job["max_attempts"],
+        result=job["result"],
+        error=job["error"]
+    )
+
+@app.delete("/jobs/{job_id}", response_model=JobStatusResponse)
+async def cancel_job(job_id: str, api_key: str = Depends(get_api_key)):
+    """
+    取消合成任务，排队中的任务直接取消，执行中的任务由 worker 终止
+
+    - **job_id**: 任务ID
+    """
+    if not job_broker:
+        raise JobNotFoundError(job_id)
+    result = await run_in_threadpool(job_broker.cancel, job_id, CANCEL_CLIENT)
+    job = await run_in_threadpool(job_broker.get, job_id)
+    if not job:
+        raise JobNotFoundError(job_id)
+    if result == JOB_CANCELLED:
+        # 排队中的任务不会再被 worker 领取，由这里删除随任务提交的提示语音文件；
+        # 执行中的任务由 worker 终止时计数并清理
+        metrics.inc("tts_cancellations_total", {"reason": CANCEL_CLIENT})
+        prompt_speech_path = job["payload"].get("prompt_speech_path")
+        if prompt_speech_path and os.path.exists(prompt_speech_path):
+            os.remove(prompt_speech_path)
+    return job_status_response(job)
+
+@app.get("/metrics")
+async def get_metrics():
+    """以Prometheus文本格式输出本进程的指标"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/stream/{project_id}")
 async def stream_project(
     project_id: str,
+    request: Request,
+    variants: bool = False
+):
+    """
+    流式获取指定项目的音频
+
+    - **variants**: (可选) 为 true 时返回多码率主播放列表
+    """
+    try:
+        if variants:
+            m3u8_content = stream_service.generate_master_playlist(
+                project_id=project_id,
+                renditions=rendition_cache.get_hls_renditions()
+            )
+        else:
+            m3u8_content = stream_service.generate_m3u8_playlist(
+                project_id=project_id,
+                request=request
+            )
+        
+        return Response(
+            content=m3u8_content,
+            media_type="application/vnd.apple.mpegurl"
+        )
+    except Exception as e:
+        # 现在logger已定义，可以正常使用
+        logger.error(f"Error streaming project {project_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error streaming project: {str(e)}")
+
+@app.get("/stream/{project_id}/{rendition}")
+async def stream_project_rendition(
+    project_id: str,
+    rendition: str,
     request: Request
 ):
-    """流式获取指定项目的音频"""
+    """流式获取指定项目某个码率档位的音频"""
+    if rendition not in rendition_cache.get_hls_renditions():
+        raise HTTPException(status_code=404, detail=f"Rendition {rendition} not found")
     try:
         m3u8_content = stream_service.generate_m3u8_playlist(
             project_id=project_id,
-            request=request
+            request=request,
+            rendition=rendition
         )
-        
+
         return Response(
             content=m3u8_content,
             media_type="application/vnd.apple.mpegurl"
         )
     except Exception as e:
-        # 现在logger已定义，可以正常使用
-        logger.error(f"Error streaming project {project_id}: {str(e)}")
+        logger.error(f"Error streaming project {project_id} rendition {rendition}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error streaming project: {str(e)}")
 
 @app.get("/projects/{project_id}/files", response_model=ProjectFilesResponse)
@@ -1,10 +1,30 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional, Dict, Any
 
 class SynthesizeResponse(BaseModel):
     status: str
     project_id: str
     stream_url: str
+    job_id: Optional[str] = None
+
+class ResynthesizeResponse(BaseModel):
+    status: str
+    project_id: str
+    stream_url: str
+    total_segments: Optional[int] = None
+    reused_segments: Optional[int] = None
+    synthesized_segments: Optional[int] = None
+    removed_segments: Optional[int] = None
+    job_id: Optional[str] = None
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
 
 class AudioFileInfo(BaseModel):
     order: int
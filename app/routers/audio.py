@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from app.services.rendition_cache import RenditionCache
 import os
 import logging
 
 router = APIRouter()
+rendition_cache = RenditionCache()
 
 @router.get("/audio/{project}/{filename}")
 async def get_audio_file(project: str, filename: str):
@@ -15,3 +18,19 @@ async def get_audio_file(project: str, filename: str):
     except Exception as e:
         logging.error(f"Error getting audio file {filename} for project {project}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error retrieving audio file: {str(e)}")
+
+@router.get("/audio/{project}/{rendition}/{filename}")
+async def get_rendition_audio_file(project: str, rendition: str, filename: str):
+    try:
+        # 首次请求时转码(耗时操作放到线程池)，之后直接返回缓存文件
+        audio_path, media_type = await run_in_threadpool(
+            rendition_cache.get_segment, project, rendition, filename
+        )
+        return FileResponse(audio_path, media_type=media_type)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Rendition {rendition} not found")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Audio file {filename} not found for project {project}")
+    except Exception as e:
+        logging.error(f"Error getting {rendition} audio file {filename} for project {project}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving audio file: {str(e)}")
@@ -1,6 +1,11 @@
 from pydub import AudioSegment
 from app.core.config import get_settings
+from typing import Optional
+import io
 import os
+import uuid
+import wave
+import struct
 
 class AudioProcessor:
     def __init__(self):
@@ -28,6 +33,44 @@ class AudioProcessor:
             return output_path
         except Exception as e:
             raise RuntimeError(f"Audio conversion failed: {str(e)}")
+
+    def transcode(
+        self,
+        input_path: str,
+        output_path: str,
+        output_format: str,
+        codec: Optional[str] = None,
+        bitrate: Optional[str] = None
+    ) -> str:
+        """
+        按指定编码器和码率转码音频文件
+
+        参数:
+            input_path: 输入文件路径
+            output_path: 输出文件路径
+            output_format: ffmpeg容器格式 (flac, ogg, adts等)
+            codec: 编码器 (libopus, aac等)，为空时使用容器默认编码器
+            bitrate: 目标码率 (如 64k)，为空时使用编码器默认码率
+
+        返回:
+            转码后的文件路径
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Input file not found: {input_path}")
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # 先写入临时文件再重命名，避免并发读取到写了一半的文件
+        temp_path = f"{output_path}.{uuid.uuid4().hex}.part"
+
+        try:
+            audio = AudioSegment.from_file(input_path)
+            audio.export(temp_path, format=output_format, codec=codec, bitrate=bitrate)
+            os.replace(temp_path, output_path)
+            return output_path
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise RuntimeError(f"Audio transcoding failed: {str(e)}")
             
     def get_audio_duration(self, audio_path: str) -> float:
         """
@@ -46,4 +89,45 @@ class AudioProcessor:
             audio = AudioSegment.from_file(audio_path)
             return len(audio) / 1000.0  # 毫秒转秒
         except Exception as e:
-            raise RuntimeError(f"Failed to get audio duration: {str(e)}")
\ No newline at end of file
+            raise RuntimeError(f"Failed to get audio duration: {str(e)}")
+
+    def get_streaming_wav_header(self, sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+        """
+        生成流式传输用的WAV文件头，数据长度未知时使用最大值
+
+        参数:
+            sample_rate: 采样率
+            channels: 声道数
+            sample_width: 采样位宽(字节)
+
+        返回:
+            44字节的WAV文件头
+        """
+        byte_rate = sample_rate * channels * sample_width
+        block_align = channels * sample_width
+        return (
+            b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, sample_width * 8)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF)
+        )
+
+    def pcm_to_wav_bytes(self, pcm: bytes, sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+        """
+        将PCM音频封装为WAV文件数据
+
+        参数:
+            pcm: PCM音频
+            sample_rate: 采样率
+            channels: 声道数
+            sample_width: 采样位宽(字节)
+
+        返回:
+            WAV文件数据
+        """
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(channels)
+            wav_file.setsampwidth(sample_width)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(pcm)
+        return buffer.getvalue()
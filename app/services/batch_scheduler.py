@@ -0,0 +1,280 @@
+import time
+import uuid
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import get_settings
+from app.core.exceptions import TTSError, RequestCancelledError
+from app.core.cancellation import CancellationToken
+from app.core.metrics import metrics
+from app.inference import protocol
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("tts_batches_total", "Batched generations run by the inference backend")
+metrics.describe("tts_batch_size", "Number of sentences per batched generation")
+metrics.describe("tts_batch_wait_seconds", "Time a sentence waited in the batching queue")
+metrics.describe("tts_batch_pending", "Sentences waiting to be batched")
+metrics.describe("tts_batch_max_size", "Configured maximum batch size")
+metrics.describe("tts_batch_max_wait_seconds", "Configured batching wait window")
+
+
+class _BatchItem:
+    __slots__ = ("id", "text", "prompt_speech_path", "prompt_text", "future", "enqueued_at")
+
+    def __init__(self, text: str, prompt_speech_path: Optional[str], prompt_text: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.text = text
+        self.prompt_speech_path = prompt_speech_path
+        self.prompt_text = prompt_text
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class BatchScheduler:
+    def __init__(
+        self,
+        worker_command: Tuple[List[str], Optional[str]],
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        length_bucket: Optional[int] = None
+    ):
+        """
+        跨请求的动态批量调度器
+
+        来自不同请求、使用相同提示语音且长度相近的句子进入同一分组，分组凑满
+        max_batch_size 或最早的句子等待超过 max_wait_ms 后，作为一个批次交给
+        常驻的批量推理worker做一次批量生成，再把结果分发回各个调用方。
+
+        参数:
+            worker_command: 批量推理worker的 (命令行参数列表, 工作目录)
+            max_batch_size: 批大小上限
+            max_wait_ms: 最长等待时间(毫秒)
+            length_bucket: 长度分组的字符数区间，不大于0时不按长度分组
+        """
+        if max_batch_size is None or max_wait_ms is None or length_bucket is None:
+            settings = get_settings()
+            max_batch_size = settings.BATCH_MAX_SIZE if max_batch_size is None else max_batch_size
+            max_wait_ms = settings.BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+            length_bucket = settings.BATCH_LENGTH_BUCKET if length_bucket is None else length_bucket
+
+        self.worker_command = worker_command
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max(max_wait_ms, 0) / 1000
+        self.length_bucket = length_bucket
+
+        # 分组键 -> 按入队顺序排列的待处理句子
+        self._pending: Dict[Tuple, List[_BatchItem]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._writer: Optional[protocol.FrameWriter] = None
+        self._read_seq = 0
+
+        metrics.set("tts_batch_max_size", self.max_batch_size)
+        metrics.set("tts_batch_max_wait_seconds", self.max_wait)
+
+    async def start(self):
+        """提前启动批量推理worker，避免首个批次承担进程启动和模型加载的时间"""
+        await self._ensure_worker()
+
+    async def close(self):
+        """停止调度循环和批量推理worker，尚未完成的句子以 TTSError 失败"""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        pending = [item for items in self._pending.values() for item in items]
+        self._pending.clear()
+        self._update_pending_gauge()
+        self._fail_items(pending, TTSError("Batch scheduler closed"))
+        await self._stop_worker()
+
+    async def submit(
+        self,
+        text: str,
+        prompt_speech_path: Optional[str] = None,
+        prompt_text: Optional[str] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        提交一个句子，等待所在批次完成
+
+        返回:
+            (PCM音频, 音频参数 {sample_rate, channels, sample_width})
+        """
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+
+        item = _BatchItem(text, prompt_speech_path, prompt_text)
+        self._pending.setdefault(self._batch_key(item), []).append(item)
+        self._update_pending_gauge()
+        self._ensure_dispatcher()
+        self._wakeup.set()
+
+        if cancel_token is None:
+            return await item.future
+
+        cancelled = asyncio.ensure_future(cancel_token.wait())
+        try:
+            await asyncio.wait({item.future, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+        if item.future.done():
+            return item.future.result()
+
+        # 尚未进入批次的句子直接移出队列；已在批次中的句子无法单独中止，结果被丢弃
+        self._remove_pending(item)
+        item.future.cancel()
+        raise RequestCancelledError(cancel_token.reason)
+
+    def _batch_key(self, item: _BatchItem) -> Tuple:
+        length_group = len(item.text) // self.length_bucket if self.length_bucket > 0 else 0
+        return item.prompt_speech_path, item.prompt_text, length_group
+
+    def _remove_pending(self, item: _BatchItem):
+        key = self._batch_key(item)
+        items = self._pending.get(key)
+        if items and item in items:
+            items.remove(item)
+            if not items:
+                del self._pending[key]
+            self._update_pending_gauge()
+
+    def _update_pending_gauge(self):
+        metrics.set("tts_batch_pending", sum(len(items) for items in self._pending.values()))
+
+    def _ensure_dispatcher(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def _dispatch_loop(self):
+        """调度循环: 一次只运行一个批次，运行期间新到的句子继续在队列中累积"""
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # 凑满或最早的句子已超过等待时间的分组可以发出，多个分组就绪时优先发出等待最久的
+            now = time.monotonic()
+            ready = [
+                (items[0].enqueued_at, key)
+                for key, items in self._pending.items()
+                if len(items) >= self.max_batch_size or items[0].enqueued_at + self.max_wait <= now
+            ]
+            if not ready:
+                # 没有就绪的分组时，等到最早到期的分组超时或有新句子入队
+                wait_left = min(items[0].enqueued_at for items in self._pending.values()) + self.max_wait - now
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait_left)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, key = min(ready, key=lambda entry: entry[0])
+            items = self._pending[key]
+            batch = items[:self.max_batch_size]
+            if len(items) > self.max_batch_size:
+                self._pending[key] = items[self.max_batch_size:]
+            else:
+                del self._pending[key]
+            self._update_pending_gauge()
+
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                continue
+            try:
+                await self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} sentences failed: {str(e)}")
+                self._fail_items(batch, TTSError(f"Batched synthesis failed: {str(e)}"))
+
+    async def _run_batch(self, batch: List[_BatchItem]):
+        now = time.monotonic()
+        metrics.inc("tts_batches_total")
+        metrics.observe("tts_batch_size", len(batch))
+        for item in batch:
+            metrics.observe("tts_batch_wait_seconds", now - item.enqueued_at)
+
+        await self._ensure_worker()
+        self._writer.batch([
+            {
+                "id": item.id,
+                "text": item.text,
+                "prompt_speech_path": item.prompt_speech_path,
+                "prompt_text": item.prompt_text,
+            }
+            for item in batch
+        ])
+        await self._process.stdin.drain()
+
+        waiting = {item.id: item for item in batch}
+        try:
+            while waiting:
+                frame = await protocol.read_frame(self._process.stdout)
+                if frame is None:
+                    raise TTSError("Batch inference worker exited unexpectedly")
+                frame_type, seq, payload = frame
+                if seq != self._read_seq:
+                    raise TTSError(f"Batch frame out of sequence: expected {self._read_seq}, got {seq}")
+                self._read_seq += 1
+
+                if frame_type == protocol.FRAME_ERROR:
+                    # 整批失败，worker 仍可继续处理后续批次
+                    message = payload.decode("utf-8", errors="replace")
+                    self._fail_items(list(waiting.values()), TTSError(f"Spark-TTS batch failed: {message}"))
+                    return
+                if frame_type != protocol.FRAME_RESULT:
+                    raise TTSError(f"Unexpected frame type from batch inference worker: {frame_type}")
+
+                header, pcm = protocol.decode_result(payload)
+                item = waiting.pop(header.get("id"), None)
+                if item is None or item.future.done():
+                    continue
+                if header.get("error"):
+                    item.future.set_exception(TTSError(f"Spark-TTS failed: {header['error']}"))
+                else:
+                    item.future.set_result((pcm, {
+                        "sample_rate": int(header["sample_rate"]),
+                        "channels": int(header.get("channels", 1)),
+                        "sample_width": int(header.get("sample_width", 2)),
+                    }))
+        except (TTSError, protocol.ProtocolError, ConnectionError):
+            # worker 状态未知，终止后在下一个批次重新启动
+            await self._stop_worker()
+            raise
+
+    def _fail_items(self, items: List[_BatchItem], error: Exception):
+        for item in items:
+            if not item.future.done():
+                item.future.set_exception(error)
+
+    async def _ensure_worker(self):
+        """启动常驻的批量推理worker，已退出时重新启动"""
+        if self._process is not None and self._process.returncode is None:
+            return
+        cmd, cwd = self.worker_command
+        self._process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=None,  # 错误输出直接进入服务日志
+            cwd=cwd,
+            start_new_session=True
+        )
+        self._writer = protocol.FrameWriter(protocol.StreamWriterAdapter(self._process.stdin))
+        self._read_seq = 0
+
+    async def _stop_worker(self):
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        self._process = None
+        self._writer = None
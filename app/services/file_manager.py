@@ -1,7 +1,16 @@
 import os
+import json
+import uuid
+import fcntl
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, Iterable
 from app.core.config import get_settings
+from app.utils.segment_diff import get_segment_order, assign_segment_names
+
+# 重新编号计划的阶段: 删除旧片段并暂存待改名的片段 / 把暂存的片段改为新文件名
+RENUMBER_STAGING = "staging"
+RENUMBER_RENAMING = "renaming"
 
 class FileManager:
     def __init__(self):
@@ -20,8 +29,11 @@ class FileManager:
     def get_next_order_index(self, project_id: str) -> int:
         """获取下一个序号"""
         project_path = Path(self.get_project_path(project_id))
+        self.recover_project(project_id)
         max_order = 0
-        for file in project_path.glob("*.wav"):
+        for file in project_path.iterdir():
+            if not file.is_file() or not self._is_audio_file(file.name):
+                continue
             try:
                 order = int(file.stem.split("_")[0])
                 max_order = max(max_order, order)
@@ -38,11 +50,170 @@ class FileManager:
             f.write(audio_data)
         return str(filepath)
         
+    def get_manifest_path(self, project_id: str) -> str:
+        """获取项目清单文件路径，清单记录每个音频片段对应的文本"""
+        return os.path.join(self.get_project_path(project_id), "manifest.json")
+
+    def load_segment_texts(self, project_id: str) -> Dict[str, str]:
+        """读取项目清单，返回 文件名 -> 文本 的映射"""
+        self.recover_project(project_id)
+        return self._read_manifest(project_id).get("segments", {})
+
+    def _read_manifest(self, project_id: str) -> Dict[str, Any]:
+        manifest_path = self.get_manifest_path(project_id)
+        if not os.path.exists(manifest_path):
+            return {}
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, project_id: str, manifest: Dict[str, Any]):
+        """整体覆盖写入项目清单，调用方需持有项目锁"""
+        manifest_path = self.get_manifest_path(project_id)
+        # 每个写入方使用独立的临时文件，并发写入时不会互相覆盖或删除
+        temp_path = f"{manifest_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, manifest_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @contextmanager
+    def project_lock(self, project_id: str):
+        """项目级的跨进程排他锁，保护项目清单的读取-修改-写入，不可重入"""
+        lock_path = os.path.join(self.get_project_path(project_id), ".lock")
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update_segment_texts(self, project_id: str, updates: Dict[str, Optional[str]]):
+        """
+        在项目锁内合并更新项目清单
+
+        参数:
+            updates: 文件名 -> 文本，文本为 None 时删除该记录
+        """
+        with self.project_lock(project_id):
+            manifest = self._read_manifest(project_id)
+            self._finish_renumber(project_id, manifest)
+            segment_texts = manifest.setdefault("segments", {})
+            for filename, text in updates.items():
+                if text is None:
+                    segment_texts.pop(filename, None)
+                else:
+                    segment_texts[filename] = text
+            self._write_manifest(project_id, manifest)
+
+    def save_segment_text(self, project_id: str, filename: str, text: str):
+        """在项目清单中记录单个音频片段的文本"""
+        self.update_segment_texts(project_id, {filename: text})
+
+    def renumber_segments(
+        self,
+        project_id: str,
+        segments: List[Tuple[str, str]],
+        removed: List[str],
+        taken_orders: Iterable[int] = ()
+    ) -> List[str]:
+        """
+        删除不再使用的片段，并按新顺序重新编号片段，同时合并更新项目清单
+
+        执行前先把操作计划写入项目清单，进程中途退出时由下一次读取项目(recover_project)继续完成。
+        不在计划中的片段(并发写入的片段)保持原文件名和清单记录，其序号在分配时跳过
+
+        参数:
+            segments: 按新顺序排列的 (片段文件名, 文本)
+            removed: 要删除的片段文件名
+            taken_orders: 其他写入方已预留但可能尚未写入文件的序号
+
+        返回:
+            与 segments 一一对应的新文件名
+        """
+        project_path = self.get_project_path(project_id)
+        with self.project_lock(project_id):
+            manifest = self._read_manifest(project_id)
+            self._finish_renumber(project_id, manifest)
+
+            planned = {filename for filename, _ in segments} | set(removed)
+            taken = set(taken_orders)
+            for filename in os.listdir(project_path):
+                if filename not in planned and self._is_audio_file(filename):
+                    order = get_segment_order(filename)
+                    if order is not None:
+                        taken.add(order)
+            targets = assign_segment_names([filename for filename, _ in segments], project_id, taken)
+
+            manifest["renumber"] = {
+                "phase": RENUMBER_STAGING,
+                "removed": removed,
+                # 原文件名 -> 临时文件名 -> 新文件名，先全部改为临时文件名再改为新文件名，避免互相覆盖
+                "renames": [
+                    [source, f"{source}.{uuid.uuid4().hex}.renumber", target]
+                    for (source, _), target in zip(segments, targets)
+                    if source != target
+                ],
+                "texts": {target: text for (_, text), target in zip(segments, targets)},
+                "sources": [source for source, _ in segments],
+            }
+            self._write_manifest(project_id, manifest)
+            self._finish_renumber(project_id, manifest)
+        return targets
+
+    def recover_project(self, project_id: str):
+        """继续完成进程中途退出时未完成的重新编号"""
+        if "renumber" not in self._read_manifest(project_id):
+            return
+        with self.project_lock(project_id):
+            self._finish_renumber(project_id, self._read_manifest(project_id))
+
+    def _finish_renumber(self, project_id: str, manifest: Dict[str, Any]):
+        """执行项目清单中记录的重新编号计划，每一步都可重复执行，调用方需持有项目锁"""
+        plan = manifest.get("renumber")
+        if not plan:
+            return
+        project_path = self.get_project_path(project_id)
+
+        if plan["phase"] == RENUMBER_STAGING:
+            for filename in plan["removed"]:
+                path = os.path.join(project_path, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            for source, staged, _ in plan["renames"]:
+                source_path = os.path.join(project_path, source)
+                if os.path.exists(source_path):
+                    os.rename(source_path, os.path.join(project_path, staged))
+            # 删除和暂存完成后新文件名不再被占用，之后的步骤不会再删除或暂存任何文件
+            plan["phase"] = RENUMBER_RENAMING
+            self._write_manifest(project_id, manifest)
+
+        for _, staged, target in plan["renames"]:
+            staged_path = os.path.join(project_path, staged)
+            if os.path.exists(staged_path):
+                target_path = os.path.join(project_path, target)
+                os.rename(staged_path, target_path)
+                # 更新修改时间，使按文件名缓存的转码结果失效
+                os.utime(target_path)
+
+        segment_texts = manifest.setdefault("segments", {})
+        for filename in plan["removed"] + plan["sources"]:
+            segment_texts.pop(filename, None)
+        segment_texts.update(plan["texts"])
+        del manifest["renumber"]
+        self._write_manifest(project_id, manifest)
+
     def get_project_files(self, project_id: str) -> List[Dict[str, Any]]:
         """获取项目的所有文件信息"""
         project_path = self.get_project_path(project_id)
         if not os.path.exists(project_path):
             return []
+        self.recover_project(project_id)
         
         files = []
         print(f"Scanning directory: {project_path}")
@@ -0,0 +1,423 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import importlib
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional
+from app.core.config import get_settings
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_LEASED = "leased"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+
+class JobBroker(ABC):
+    """
+    任务队列接口
+
+    API进程通过 enqueue 提交任务，合成worker进程通过 lease 领取任务。
+    领取的任务在可见性超时(visibility timeout)内对其他worker不可见，
+    worker崩溃或超时未完成时任务会被重新领取，直到超过最大尝试次数。
+    """
+
+    @abstractmethod
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> str:
+        """提交任务，返回任务ID"""
+
+    @abstractmethod
+    def lease(self, worker_id: str, visibility_timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        领取一个可执行的任务，没有任务时返回 None
+
+        同一项目(payload 中的 project_id)同时最多只有一个任务被领取，
+        避免多个worker为同一项目分配相同的片段序号或同时改写项目清单
+        """
+
+    @abstractmethod
+    def reap_expired(self) -> List[Dict[str, Any]]:
+        """
+        结束租约已过期且不会再被领取的任务: 已请求取消的标记为已取消，已用完尝试次数的标记为失败
+
+        返回:
+            被结束的任务，由调用方清理任务附带的文件(如提示语音)
+        """
+
+    @abstractmethod
+    def hold_project(
+        self,
+        project_id: str,
+        holder_id: str,
+        kind: str,
+        visibility_timeout: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        在队列之外直接执行的操作(流式合成)占用项目
+
+        创建一个已被 holder_id 领取的任务记录，租约有效期间worker不会领取该项目的任务；
+        通过 extend_lease 续约，complete 释放。持有者崩溃后租约过期，记录由 reap_expired 标记为失败，不会被worker执行
+
+        返回:
+            任务ID，项目已有任务正在执行时返回 None
+        """
+
+    @abstractmethod
+    def extend_lease(self, job_id: str, worker_id: str, visibility_timeout: Optional[float] = None) -> bool:
+        """延长任务的租约，租约已被其他worker接管时返回 False"""
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        """标记任务成功完成"""
+
+    @abstractmethod
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """标记任务执行失败，未超过最大尝试次数时重新排队"""
+
+    @abstractmethod
+    def release(self, job_id: str, worker_id: str) -> bool:
+        """worker 停止时交还执行中的任务，任务立即重新排队且不计入尝试次数"""
+
+    @abstractmethod
+    def cancel(self, job_id: str, reason: str) -> Optional[str]:
+        """
+        取消任务: 排队中的任务直接标记为已取消，执行中的任务标记为请求取消，
+        由执行它的worker在下次心跳时终止并调用 finish_cancelled
+
+        返回:
+            JOB_CANCELLED(已取消) / JOB_LEASED(已请求取消) / None(任务不存在或已结束)
+        """
+
+    @abstractmethod
+    def finish_cancelled(self, job_id: str, worker_id: str, reason: str) -> bool:
+        """worker 终止执行中的任务后标记为已取消"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务信息"""
+
+
+class SQLiteJobBroker(JobBroker):
+    def __init__(self, db_path: Optional[str] = None):
+        """初始化基于SQLite的任务队列，多个进程可共享同一个数据库文件"""
+        self.settings = get_settings()
+        self.db_path = db_path or self.settings.JOB_BROKER_URL or os.path.join(
+            self.settings.PROJECT_FILES_DIR, "jobs.sqlite3"
+        )
+        db_dir = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                worker_id TEXT,
+                project_id TEXT,
+                available_at REAL NOT NULL,
+                lease_expires_at REAL,
+                result TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at)"
+        )
+        # 兼容旧版本创建的数据库
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "cancel_requested" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+        if "project_id" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN project_id TEXT")
+            conn.execute("UPDATE jobs SET project_id = json_extract(payload, '$.project_id')")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_project_status ON jobs (project_id, status)")
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._connect().execute(
+            """
+            INSERT INTO jobs (id, kind, payload, status, project_id, max_attempts, available_at, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                job_id,
+                kind,
+                json.dumps(payload, ensure_ascii=False),
+                JOB_QUEUED,
+                payload.get("project_id"),
+                max_attempts or self.settings.JOB_MAX_ATTEMPTS,
+                now,
+                now,
+                now,
+            ),
+        )
+        return job_id
+
+    def lease(self, worker_id: str, visibility_timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        timeout = visibility_timeout or self.settings.JOB_VISIBILITY_TIMEOUT
+        conn = self._connect()
+        now = time.time()
+        # BEGIN IMMEDIATE 获取写锁，保证同一任务只会被一个worker领取
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 租约过期的任务在未请求取消且仍有尝试次数时重新领取，其余由 reap_expired 结束；
+            # 跳过所属项目已有任务正在执行(租约未过期)的任务
+            row = conn.execute(
+                """
+                SELECT id FROM jobs AS candidate
+                WHERE ((status = ? AND available_at <= ?)
+                       OR (status = ? AND lease_expires_at < ? AND attempts < max_attempts AND cancel_requested = 0))
+                  AND (project_id IS NULL OR NOT EXISTS (
+                      SELECT 1 FROM jobs AS running
+                      WHERE running.project_id = candidate.project_id AND running.id != candidate.id
+                        AND running.status = ? AND running.lease_expires_at >= ?
+                  ))
+                ORDER BY available_at, created_at
+                LIMIT 1
+                """,
+                (JOB_QUEUED, now, JOB_LEASED, now, JOB_LEASED, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                """
+                UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1,
+                    lease_expires_at = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (JOB_LEASED, worker_id, now + timeout, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def reap_expired(self) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                """
+                SELECT id, cancel_requested FROM jobs
+                WHERE status = ? AND lease_expires_at < ? AND (cancel_requested = 1 OR attempts >= max_attempts)
+                """,
+                (JOB_LEASED, now),
+            ).fetchall()
+            for row in rows:
+                if row["cancel_requested"]:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker_id = NULL, updated_at = ? WHERE id = ?",
+                        (JOB_CANCELLED, now, row["id"]),
+                    )
+                else:
+                    conn.execute(
+                        """
+                        UPDATE jobs SET status = ?, error = COALESCE(error, 'Lease expired'),
+                            worker_id = NULL, updated_at = ?
+                        WHERE id = ?
+                        """,
+                        (JOB_FAILED, now, row["id"]),
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [self.get(row["id"]) for row in rows]
+
+    def hold_project(
+        self,
+        project_id: str,
+        holder_id: str,
+        kind: str,
+        visibility_timeout: Optional[float] = None
+    ) -> Optional[str]:
+        timeout = visibility_timeout or self.settings.JOB_VISIBILITY_TIMEOUT
+        job_id = str(uuid.uuid4())
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            running = conn.execute(
+                "SELECT 1 FROM jobs WHERE project_id = ? AND status = ? AND lease_expires_at >= ? LIMIT 1",
+                (project_id, JOB_LEASED, now),
+            ).fetchone()
+            if running is not None:
+                conn.execute("COMMIT")
+                return None
+            # attempts 等于 max_attempts，租约过期后由 reap_expired 标记为失败而不会被重新领取
+            conn.execute(
+                """
+                INSERT INTO jobs (id, kind, payload, status, attempts, max_attempts, worker_id, project_id,
+                    available_at, lease_expires_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 1, 1, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job_id,
+                    kind,
+                    json.dumps({"project_id": project_id}),
+                    JOB_LEASED,
+                    holder_id,
+                    project_id,
+                    now,
+                    now + timeout,
+                    now,
+                    now,
+                ),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def extend_lease(self, job_id: str, worker_id: str, visibility_timeout: Optional[float] = None) -> bool:
+        timeout = visibility_timeout or self.settings.JOB_VISIBILITY_TIMEOUT
+        now = time.time()
+        cursor = self._connect().execute(
+            """
+            UPDATE jobs SET lease_expires_at = ?, updated_at = ?
+            WHERE id = ? AND status = ? AND worker_id = ?
+            """,
+            (now + timeout, now, job_id, JOB_LEASED, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        now = time.time()
+        cursor = self._connect().execute(
+            """
+            UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND status = ? AND worker_id = ?
+            """,
+            (JOB_SUCCEEDED, json.dumps(result or {}, ensure_ascii=False), now, job_id, JOB_LEASED, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        now = time.time()
+        # 重试时按尝试次数指数退避
+        cursor = self._connect().execute(
+            """
+            UPDATE jobs SET
+                status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,
+                available_at = ? + ? * (1 << (attempts - 1)),
+                worker_id = NULL, lease_expires_at = NULL, error = ?, updated_at = ?
+            WHERE id = ? AND status = ? AND worker_id = ?
+            """,
+            (
+                JOB_FAILED,
+                JOB_QUEUED,
+                now,
+                self.settings.JOB_RETRY_BACKOFF,
+                error,
+                now,
+                job_id,
+                JOB_LEASED,
+                worker_id,
+            ),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, job_id: str, worker_id: str) -> bool:
+        now = time.time()
+        cursor = self._connect().execute(
+            """
+            UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), available_at = ?,
+                worker_id = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND status = ? AND worker_id = ?
+            """,
+            (JOB_QUEUED, now, now, job_id, JOB_LEASED, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def cancel(self, job_id: str, reason: str) -> Optional[str]:
+        now = time.time()
+        conn = self._connect()
+        cursor = conn.execute(
+            """
+            UPDATE jobs SET status = ?, error = ?, updated_at = ?
+            WHERE id = ? AND status = ?
+            """,
+            (JOB_CANCELLED, f"Cancelled: {reason}", now, job_id, JOB_QUEUED),
+        )
+        if cursor.rowcount == 1:
+            return JOB_CANCELLED
+        cursor = conn.execute(
+            """
+            UPDATE jobs SET cancel_requested = 1, error = ?, updated_at = ?
+            WHERE id = ? AND status = ?
+            """,
+            (f"Cancelled: {reason}", now, job_id, JOB_LEASED),
+        )
+        return JOB_LEASED if cursor.rowcount == 1 else None
+
+    def finish_cancelled(self, job_id: str, worker_id: str, reason: str) -> bool:
+        now = time.time()
+        cursor = self._connect().execute(
+            """
+            UPDATE jobs SET status = ?, error = ?, worker_id = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE id = ? AND status = ? AND worker_id = ?
+            """,
+            (JOB_CANCELLED, f"Cancelled: {reason}", now, job_id, JOB_LEASED, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+
+def get_job_broker() -> JobBroker:
+    """
+    根据配置创建任务队列
+
+    JOB_BROKER_BACKEND 为 sqlite 时使用内置的 SQLiteJobBroker，
+    也可以填写 "模块路径:类名" 使用自定义实现
+    """
+    settings = get_settings()
+    backend = settings.JOB_BROKER_BACKEND
+    if backend == "sqlite":
+        return SQLiteJobBroker()
+
+    module_name, _, class_name = backend.partition(":")
+    if not class_name:
+        raise ValueError(f"Invalid JOB_BROKER_BACKEND: {backend}")
+    broker_class = getattr(importlib.import_module(module_name), class_name)
+    return broker_class()
@@ -0,0 +1,251 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import get_settings
+from app.services.file_manager import FileManager
+from app.services.audio_processor import AudioProcessor
+
+# 可用的码率档位定义
+# format/codec/bitrate 传给 ffmpeg，bandwidth/codecs 用于主播放列表的 EXT-X-STREAM-INF
+# hls 表示片段能否作为HLS媒体片段: HLS只支持MPEG-TS/fMP4片段和AAC(ADTS)、MP3等打包音频，
+# WAV、FLAC、Ogg 档位只能通过 /audio/{project}/{rendition}/{filename} 直接下载，不会出现在播放列表中
+RENDITIONS: Dict[str, Dict[str, Any]] = {
+    "original": {
+        "format": None,  # 直接使用原始片段文件，不转码
+        "extension": None,
+        "codec": None,
+        "bitrate": None,
+        "bandwidth": 256000,
+        "codecs": None,
+        "media_type": None,
+        "hls": False,
+    },
+    "flac": {
+        "format": "flac",
+        "extension": "flac",
+        "codec": "flac",
+        "bitrate": None,
+        "bandwidth": 160000,
+        "codecs": "fLaC",
+        "media_type": "audio/flac",
+        "hls": False,
+    },
+    "opus_64k": {
+        "format": "ogg",
+        "extension": "ogg",
+        "codec": "libopus",
+        "bitrate": "64k",
+        "bandwidth": 64000,
+        "codecs": "opus",
+        "media_type": "audio/ogg",
+        "hls": False,
+    },
+    "opus_24k": {
+        "format": "ogg",
+        "extension": "ogg",
+        "codec": "libopus",
+        "bitrate": "24k",
+        "bandwidth": 24000,
+        "codecs": "opus",
+        "media_type": "audio/ogg",
+        "hls": False,
+    },
+    "aac_64k": {
+        "format": "adts",
+        "extension": "aac",
+        "codec": "aac",
+        "bitrate": "64k",
+        "bandwidth": 64000,
+        "codecs": "mp4a.40.2",
+        "media_type": "audio/aac",
+        "hls": True,
+    },
+    "aac_24k": {
+        "format": "adts",
+        "extension": "aac",
+        "codec": "aac",
+        "bitrate": "24k",
+        "bandwidth": 24000,
+        "codecs": "mp4a.40.2",
+        "media_type": "audio/aac",
+        "hls": True,
+    },
+    "mp3_128k": {
+        "format": "mp3",
+        "extension": "mp3",
+        "codec": "libmp3lame",
+        "bitrate": "128k",
+        "bandwidth": 128000,
+        "codecs": "mp4a.40.34",
+        "media_type": "audio/mpeg",
+        "hls": True,
+    },
+    "mp3_64k": {
+        "format": "mp3",
+        "extension": "mp3",
+        "codec": "libmp3lame",
+        "bitrate": "64k",
+        "bandwidth": 64000,
+        "codecs": "mp4a.40.34",
+        "media_type": "audio/mpeg",
+        "hls": True,
+    },
+}
+
+def get_segment_filename(source_filename: str, rendition: str) -> str:
+    """获取原始片段在指定档位下对应的文件名"""
+    extension = RENDITIONS[rendition]["extension"]
+    if not extension:
+        return source_filename
+    return f"{Path(source_filename).stem}.{extension}"
+
+
+class RenditionCache:
+    def __init__(self):
+        """初始化转码缓存，首次请求某个档位的片段时转码，之后直接复用"""
+        self.settings = get_settings()
+        self.file_manager = FileManager()
+        self.audio_processor = AudioProcessor()
+        self.cache_dir = self.settings.RENDITION_CACHE_DIR or os.path.join(
+            self.file_manager.get_base_dir(), ".renditions"
+        )
+        self.max_bytes = int(self.settings.RENDITION_CACHE_MAX_MB * 1024 * 1024)
+
+        # 缓存索引: 缓存文件路径 -> 文件大小，按最近访问顺序排列
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # 每个缓存文件一把锁，避免同一片段被并发重复转码
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._load_index()
+
+    def get_enabled_renditions(self) -> List[str]:
+        """获取已启用的码率档位名称列表"""
+        names = [name.strip() for name in self.settings.HLS_RENDITIONS.split(",") if name.strip()]
+        return [name for name in names if name in RENDITIONS]
+
+    def get_hls_renditions(self) -> List[str]:
+        """获取已启用且可用于HLS播放列表的码率档位名称列表"""
+        return [name for name in self.get_enabled_renditions() if RENDITIONS[name]["hls"]]
+
+    def get_rendition(self, rendition: str) -> Dict[str, Any]:
+        """获取码率档位定义，未启用或不存在时抛出 KeyError"""
+        if rendition not in self.get_enabled_renditions():
+            raise KeyError(f"Unknown rendition: {rendition}")
+        return RENDITIONS[rendition]
+
+    def get_segment_filename(self, source_filename: str, rendition: str) -> str:
+        """获取原始片段在已启用档位下对应的文件名"""
+        self.get_rendition(rendition)
+        return get_segment_filename(source_filename, rendition)
+
+    def get_segment(self, project_id: str, rendition: str, filename: str) -> Tuple[str, Optional[str]]:
+        """
+        获取指定档位的片段文件，未缓存时先转码
+
+        参数:
+            project_id: 项目ID
+            rendition: 码率档位名称
+            filename: 档位下的片段文件名
+
+        返回:
+            (片段文件路径, 媒体类型)
+        """
+        spec = self.get_rendition(rendition)
+        source_path = self._find_source(project_id, Path(filename).stem)
+        # 只接受档位对应的文件名，避免同一片段以任意扩展名生成多份缓存或以错误的扩展名返回
+        if filename != self.get_segment_filename(os.path.basename(source_path), rendition):
+            raise FileNotFoundError(f"Audio file not found: {filename}")
+
+        if not spec["format"]:
+            return source_path, None
+
+        cache_path = os.path.join(self.cache_dir, rendition, project_id, filename)
+        with self._get_key_lock(cache_path):
+            if self._is_fresh(cache_path, source_path):
+                self._touch(cache_path)
+            else:
+                self.audio_processor.transcode(
+                    source_path,
+                    cache_path,
+                    spec["format"],
+                    codec=spec["codec"],
+                    bitrate=spec["bitrate"]
+                )
+                self._add(cache_path, os.path.getsize(cache_path))
+
+        return cache_path, spec["media_type"]
+
+    def _find_source(self, project_id: str, stem: str) -> str:
+        """根据文件名(不含扩展名)精确匹配项目中的原始片段文件"""
+        project_path = os.path.join(self.file_manager.get_base_dir(), project_id)
+        if project_id not in (".", "..") and os.path.isdir(project_path):
+            for name in sorted(os.listdir(project_path)):
+                path = os.path.join(project_path, name)
+                if Path(name).stem == stem and os.path.isfile(path) and self.file_manager._is_audio_file(name):
+                    return path
+        raise FileNotFoundError(f"Audio file not found: {stem}")
+
+    def _is_fresh(self, cache_path: str, source_path: str) -> bool:
+        """缓存文件存在且不早于原始片段时视为有效"""
+        try:
+            return os.path.getmtime(cache_path) >= os.path.getmtime(source_path)
+        except OSError:
+            return False
+
+    def _get_key_lock(self, cache_path: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(cache_path, threading.Lock())
+
+    def _load_index(self):
+        """启动时扫描缓存目录重建索引，按修改时间由旧到新排列"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                if filename.endswith(".part"):
+                    # 上次异常退出遗留的半成品
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _touch(self, cache_path: str):
+        with self._lock:
+            if cache_path in self._entries:
+                self._entries.move_to_end(cache_path)
+            else:
+                size = os.path.getsize(cache_path)
+                self._entries[cache_path] = size
+                self._total_bytes += size
+
+    def _add(self, cache_path: str, size: int):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(cache_path, 0)
+            self._entries[cache_path] = size
+            self._total_bytes += size
+            self._evict(keep=cache_path)
+
+    def _evict(self, keep: Optional[str] = None):
+        """淘汰最近最少使用的缓存文件直到容量不超过上限，调用方需持有 self._lock 或处于初始化阶段"""
+        for path in list(self._entries.keys()):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._total_bytes -= self._entries.pop(path)
+            lock = self._key_locks.get(path)
+            if lock is not None and not lock.locked():
+                del self._key_locks[path]
+            try:
+                os.remove(path)
+            except OSError:
+                pass
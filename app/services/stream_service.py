@@ -3,6 +3,7 @@ import urllib.parse
 from typing import List, Dict, Optional, Any
 from app.core.config import get_settings
 from app.services.file_manager import FileManager
+from app.services.rendition_cache import RENDITIONS, get_segment_filename
 
 class StreamService:
     def __init__(self):
@@ -10,7 +11,37 @@ class StreamService:
         self.settings = get_settings()
         self.file_manager = FileManager()
     
-    def generate_m3u8_playlist(self, project_id: str, request=None, format_type=None) -> str:
+    def generate_master_playlist(self, project_id: str, renditions: List[str]) -> str:
+        """
+        生成多码率主播放列表
+
+        参数:
+            project_id: 项目ID
+            renditions: 码率档位名称列表
+
+        返回:
+            主播放列表内容
+        """
+        if not self.file_manager.get_project_files(project_id):
+            raise ValueError(f"No files found for project {project_id}")
+
+        # 按带宽从高到低排列各档位
+        sorted_renditions = sorted(renditions, key=lambda name: RENDITIONS[name]["bandwidth"], reverse=True)
+
+        m3u8_content = "#EXTM3U\n"
+        m3u8_content += "#EXT-X-VERSION:3\n"
+
+        for rendition in sorted_renditions:
+            spec = RENDITIONS[rendition]
+            stream_inf = f"#EXT-X-STREAM-INF:BANDWIDTH={spec['bandwidth']}"
+            if spec["codecs"]:
+                stream_inf += f",CODECS=\"{spec['codecs']}\""
+            m3u8_content += f"{stream_inf}\n"
+            m3u8_content += f"/spark/stream/{project_id}/{urllib.parse.quote(rendition)}\n"
+
+        return m3u8_content
+
+    def generate_m3u8_playlist(self, project_id: str, request=None, format_type=None, rendition=None) -> str:
         """
         生成m3u8播放列表
         
@@ -18,6 +49,7 @@ class StreamService:
             project_id: 项目ID
             request: HTTP请求对象(可选)
             format_type: 音频格式类型(可选)
+            rendition: 码率档位名称(可选)，为空时直接引用原始片段
         
         返回:
             m3u8播放列表内容
@@ -52,7 +84,15 @@ class StreamService:
             
             # 构建正确的音频URL路径，使用相对于应用根目录的路径
             # 使用 /spark/audio/{project_id}/{filename} 格式
-            audio_url = f"/spark/audio/{project_id}/{urllib.parse.quote(filename)}"
+            # 指定码率档位时使用 /spark/audio/{project_id}/{rendition}/{filename} 格式
+            if rendition and RENDITIONS[rendition]["extension"]:
+                segment_name = get_segment_filename(filename, rendition)
+                audio_url = (
+                    f"/spark/audio/{project_id}/{urllib.parse.quote(rendition)}/"
+                    f"{urllib.parse.quote(segment_name)}"
+                )
+            else:
+                audio_url = f"/spark/audio/{project_id}/{urllib.parse.quote(filename)}"
             
             m3u8_content += f"#EXTINF:{duration},\n"
             m3u8_content += f"{audio_url}\n"
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+import signal
+from typing import Callable, List, Optional, Tuple
+from app.core.config import get_settings
+from app.core.exceptions import TTSError, RequestCancelledError
+from app.core.cancellation import CancellationToken
+from app.inference import protocol
+
+logger = logging.getLogger(__name__)
+
+WorkerCommand = Tuple[List[str], Optional[str]]
+
+
+class StreamWorker:
+    def __init__(self, command_factory: Callable[[], WorkerCommand]):
+        """
+        常驻的流式推理worker进程，模型只加载一次，逐个处理流式合成请求
+
+        参数:
+            command_factory: 返回 (命令行参数列表, 工作目录) 的函数，每次启动进程时调用
+        """
+        self.command_factory = command_factory
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._writer: Optional[protocol.FrameWriter] = None
+        self._read_seq = 0
+        # 处于两个请求之间(已读到 END 或 ERROR)时为 True，此时进程可以继续复用
+        self.idle = True
+
+    async def _ensure_started(self):
+        """启动worker进程，已退出时重新启动"""
+        if self.process is not None and self.process.returncode is None:
+            return
+        cmd, cwd = self.command_factory()
+        self.process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=None,  # 错误输出直接进入服务日志
+            cwd=cwd,
+            start_new_session=True
+        )
+        self._writer = protocol.FrameWriter(protocol.StreamWriterAdapter(self.process.stdin))
+        self._read_seq = 0
+        self.idle = True
+
+    async def send(self, text: str, prompt_speech_path: Optional[str] = None, prompt_text: Optional[str] = None):
+        """发送一个流式合成请求，之后通过 read_frame 读取该请求的音频帧"""
+        await self._ensure_started()
+        self.idle = False
+        self._writer.request(text, prompt_speech_path, prompt_text)
+        try:
+            await self.process.stdin.drain()
+        except ConnectionError:
+            raise TTSError("Inference worker exited before accepting the request")
+
+    async def read_frame(self, cancel_token: Optional[CancellationToken] = None) -> Tuple[int, bytes]:
+        """
+        读取当前请求的下一个帧并校验序号，请求被取消时抛出 RequestCancelledError
+
+        返回:
+            (帧类型, 负载)
+        """
+        if cancel_token is None:
+            frame = await self._read_raw_frame()
+        else:
+            cancel_token.raise_if_cancelled()
+            read = asyncio.ensure_future(self._read_raw_frame())
+            cancelled = asyncio.ensure_future(cancel_token.wait())
+            try:
+                await asyncio.wait({read, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                cancelled.cancel()
+            if not read.done():
+                read.cancel()
+                raise RequestCancelledError(cancel_token.reason)
+            frame = read.result()
+
+        if frame is None:
+            raise TTSError("Inference worker exited before end of utterance")
+        frame_type, seq, payload = frame
+        if seq != self._read_seq:
+            raise TTSError(f"Stream frame out of sequence: expected {self._read_seq}, got {seq}")
+        self._read_seq += 1
+        if frame_type in (protocol.FRAME_END, protocol.FRAME_ERROR):
+            self.idle = True
+        return frame_type, payload
+
+    async def _read_raw_frame(self):
+        try:
+            return await protocol.read_frame(self.process.stdout)
+        except protocol.ProtocolError as e:
+            raise TTSError(f"Invalid stream from inference worker: {str(e)}")
+
+    def kill(self) -> Optional[asyncio.subprocess.Process]:
+        """
+        同步终止worker进程及其进程组，下一个请求会重新启动进程
+
+        返回:
+            被终止的进程，由调用方等待其退出；进程未运行时返回 None
+        """
+        process = self.process
+        self.process = None
+        self._writer = None
+        self.idle = True
+        if process is None or process.returncode is not None:
+            return None
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return process
+
+
+class StreamWorkerPool:
+    def __init__(self, command_factory: Callable[[], WorkerCommand], size: Optional[int] = None):
+        """
+        常驻流式推理worker池
+
+        每个worker同时只服务一个流式请求，其余请求等待空闲的worker。worker进程在首次使用时
+        启动并常驻，请求正常结束或推理出错(ERROR 帧)后继续复用；请求被取消或数据流异常时
+        worker 正处于生成过程中，只能终止进程，下一个请求重新启动。
+
+        参数:
+            command_factory: 返回 (命令行参数列表, 工作目录) 的函数
+            size: worker数量，每个worker各自加载一份模型
+        """
+        if size is None:
+            size = get_settings().STREAM_WORKERS
+        self.workers = [StreamWorker(command_factory) for _ in range(max(size, 1))]
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for worker in self.workers:
+            self._idle.put_nowait(worker)
+
+    async def acquire(self, cancel_token: Optional[CancellationToken] = None) -> StreamWorker:
+        """等待空闲的worker，请求被取消时抛出 RequestCancelledError"""
+        if cancel_token is None:
+            return await self._idle.get()
+
+        cancel_token.raise_if_cancelled()
+        get = asyncio.ensure_future(self._idle.get())
+        cancelled = asyncio.ensure_future(cancel_token.wait())
+        try:
+            await asyncio.wait({get, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            self._abandon(get)
+            raise
+        finally:
+            cancelled.cancel()
+        if get.done():
+            return get.result()
+        self._abandon(get)
+        raise RequestCancelledError(cancel_token.reason)
+
+    def _abandon(self, get: asyncio.Future):
+        """放弃等待，已经取到的worker放回池中"""
+        if get.done() and not get.cancelled():
+            self._idle.put_nowait(get.result())
+        else:
+            get.cancel()
+
+    def release(self, worker: StreamWorker) -> Optional[asyncio.subprocess.Process]:
+        """
+        同步归还worker，worker仍在生成(请求未读到 END 或 ERROR)时先终止其进程
+
+        客户端断开时之后的每个 await 都会被取消，因此归还不能等待
+
+        返回:
+            被终止的进程，由调用方等待其退出；没有终止进程时返回 None
+        """
+        killed = None if worker.idle else worker.kill()
+        self._idle.put_nowait(worker)
+        return killed
+
+    async def close(self):
+        """终止所有worker进程"""
+        for worker in self.workers:
+            process = worker.kill()
+            if process is not None:
+                await process.wait()
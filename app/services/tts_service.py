@@ -1,15 +1,83 @@
 import os
+import sys
 import uuid
-from typing import Optional, Tuple, List
+import wave
+import shutil
+import shlex
+import signal
+import tempfile
+import asyncio
+from typing import Optional, Tuple, List, Dict, Set, Iterable, AsyncIterator
 from app.core.config import get_settings
+from app.core.exceptions import TTSError, RequestCancelledError
+from app.core.cancellation import CancellationToken
+from app.core.metrics import metrics
+from app.inference import protocol
+from app.services.batch_scheduler import BatchScheduler
+from app.services.stream_worker_pool import StreamWorkerPool
 from app.services.file_manager import FileManager
 from app.services.audio_processor import AudioProcessor
+from app.utils.segment_diff import plan_segments
 
 class TTSService:
-    def __init__(self):
+    def __init__(self, enable_batching: Optional[bool] = None):
+        """
+        参数:
+            enable_batching: 是否启用动态批量，为空时使用 BATCHING_ENABLED；
+                启用任务队列时API进程不执行合成，应传入 False 以免加载批量推理模型
+        """
         self.settings = get_settings()
+        if enable_batching is None:
+            enable_batching = self.settings.BATCHING_ENABLED
         self.file_manager = FileManager()
         self.audio_processor = AudioProcessor()
+        # 各项目已分配但尚未写入文件的片段序号，避免并发请求取到相同的序号
+        self._reserved_orders: Dict[str, Set[int]] = {}
+        # 启用动态批量时，单句合成由常驻的批量推理worker完成
+        self.batch_scheduler = (
+            BatchScheduler(self._build_batch_worker_command())
+            if enable_batching else None
+        )
+        # 流式合成使用常驻的流式推理worker，进程在首个流式请求时启动
+        self.stream_pool = StreamWorkerPool(self._build_stream_worker_command)
+
+    async def start(self):
+        """启动常驻的推理worker，由应用启动(lifespan)或合成worker进程启动时调用"""
+        if self.batch_scheduler:
+            await self.batch_scheduler.start()
+
+    async def close(self):
+        """停止常驻的推理worker，由应用或合成worker进程退出时调用"""
+        if self.batch_scheduler:
+            await self.batch_scheduler.close()
+        await self.stream_pool.close()
+
+    def _get_spark_python(self) -> str:
+        """获取Spark-TTS虚拟环境中的Python解释器路径"""
+        return os.path.join(self.settings.SPARK_TTS_ROOT_DIR, ".venv", "bin", "python")
+
+    def _reserve_orders(self, project_id: str, count: int = 1) -> int:
+        """
+        为项目预留连续的片段序号，直到调用 _release_orders
+
+        读取已有文件与登记预留之间没有 await，在同一事件循环内是原子的
+
+        返回:
+            预留的第一个序号
+        """
+        reserved = self._reserved_orders.setdefault(project_id, set())
+        start = max([self.file_manager.get_next_order_index(project_id), *(order + 1 for order in reserved)])
+        reserved.update(range(start, start + count))
+        return start
+
+    def _release_orders(self, project_id: str, orders: Iterable[int]):
+        """释放预留的片段序号，对应文件已写入或不再需要"""
+        reserved = self._reserved_orders.get(project_id)
+        if reserved is None:
+            return
+        reserved.difference_update(orders)
+        if not reserved:
+            del self._reserved_orders[project_id]
 
     async def synthesize(
         self,
@@ -18,7 +86,9 @@ class TTSService:
         prompt_speech_path: Optional[str] = None,
         prompt_text: Optional[str] = None,
         output_format: str = "wav",
-        split_sentences: bool = False
+        split_sentences: bool = False,
+        order: Optional[int] = None,
+        cancel_token: Optional[CancellationToken] = None
     ) -> Tuple[str, str]:
         """
         合成单个文本为语音
@@ -28,6 +98,8 @@ class TTSService:
             project_id: 项目ID，如果为空则生成新的
             prompt_speech_path: 提示语音文件路径
             prompt_text: 提示文本
+            order: 片段序号，为空时预留项目的下一个序号；由调用方指定时应已通过 _reserve_orders 预留
+            cancel_token: 请求的取消标记，取消时终止正在运行的Spark-TTS进程
             
         返回:
             (project_id, 生成的音频文件路径)
@@ -35,11 +107,13 @@ class TTSService:
         if not project_id:
             project_id = str(uuid.uuid4())
             
-        order = self.file_manager.get_next_order_index(project_id)
-        project_path = self.file_manager.get_project_path(project_id)
+        reserved_orders = []
+        if order is None:
+            order = self._reserve_orders(project_id)
+            reserved_orders.append(order)
         
         # 构建Spark-TTS命令行
-        python_interpreter = os.path.join(self.settings.SPARK_TTS_ROOT_DIR, ".venv", "bin", "python")
+        python_interpreter = self._get_spark_python()
         
         # 使用相对路径，因为我们将在SPARK_TTS_ROOT_DIR目录中执行命令
         cmd = [
@@ -48,7 +122,6 @@ class TTSService:
             "cli.inference",
             "--text", text,
             "--device", str(self.settings.SPARK_TTS_DEVICE),
-            "--save_dir", project_path,
             "--model_dir", self.settings.SPARK_TTS_MODEL_DIR
         ]
         
@@ -62,34 +135,49 @@ class TTSService:
             cmd.extend(["--prompt_text", final_prompt_text])
             
         # 执行命令
-        import subprocess
-        temp_output_path = None
+        save_dir = None
         try:
-            # 设置工作目录为Spark-TTS根目录，这样Python就能找到cli模块
-            result = subprocess.run(
-                cmd,
-                check=True,
-                capture_output=True,
-                text=True,
-                cwd=self.settings.SPARK_TTS_ROOT_DIR  # 设置工作目录
-            )
-            if result.returncode != 0:
-                raise RuntimeError(f"Spark-TTS failed: {result.stderr}")
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+
+            if self.batch_scheduler:
+                # 启用动态批量时交给常驻的批量推理worker，与其他请求的句子合并生成
+                pcm, params = await self.batch_scheduler.submit(
+                    text,
+                    final_prompt_speech or None,
+                    final_prompt_text or None,
+                    cancel_token
+                )
+                audio_data = self.audio_processor.pcm_to_wav_bytes(pcm, **params)
+            else:
+                # 每次调用使用独立的临时输出目录，不会误取或误删其他请求的输出
+                save_dir = tempfile.mkdtemp(prefix="spark-tts-")
+                # 设置工作目录为Spark-TTS根目录，这样Python就能找到cli模块
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    "--save_dir", save_dir,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=self.settings.SPARK_TTS_ROOT_DIR,  # 设置工作目录
+                    start_new_session=True  # 独立进程组，取消时可连同子进程一起终止
+                )
+                _, stderr = await self._communicate(process, cancel_token)
+                if process.returncode != 0:
+                    raise RuntimeError(f"Spark-TTS execution failed: {stderr.decode('utf-8', errors='replace')}")
                 
-            # 读取生成的WAV文件（Spark-TTS会自动生成带时间戳的文件名）
-            wav_files = [f for f in os.listdir(project_path) if f.endswith('.wav')]
-            if not wav_files:
-                raise RuntimeError("No WAV file generated by Spark-TTS")
-            temp_output_path = os.path.join(project_path, wav_files[-1])  # 取最新生成的文件
-            with open(temp_output_path, "rb") as f:
-                audio_data = f.read()
+                # 读取生成的WAV文件（Spark-TTS会自动生成带时间戳的文件名）
+                wav_files = sorted(f for f in os.listdir(save_dir) if f.endswith('.wav'))
+                if not wav_files:
+                    raise RuntimeError("No WAV file generated by Spark-TTS")
+                with open(os.path.join(save_dir, wav_files[-1]), "rb") as f:  # 取最新生成的文件
+                    audio_data = f.read()
             
-            # 保存音频文件
+            # 保存音频文件(先以WAV保存，需要时再转换格式)
             final_path = self.file_manager.save_audio(
                 audio_data,
                 project_id,
                 order,
-                output_format if output_format != "wav" else "wav"
+                "wav"
             )
             
             # 如果需要格式转换且不是WAV格式
@@ -100,16 +188,56 @@ class TTSService:
                 )
                 os.remove(final_path)  # 删除原始WAV文件
                 final_path = converted_path
+
+            # 记录片段对应的文本，供增量重新合成时比对
+            self.file_manager.save_segment_text(project_id, os.path.basename(final_path), text)
             
             return project_id, final_path
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Spark-TTS execution failed: {e.stderr}")
-        except Exception as e:
-            if temp_output_path and os.path.exists(temp_output_path):
-                os.remove(temp_output_path)
-            raise
-        
-        return project_id, output_path
+        finally:
+            # 同时清理被终止的Spark-TTS进程可能留下的不完整文件
+            if save_dir:
+                shutil.rmtree(save_dir, ignore_errors=True)
+            self._release_orders(project_id, reserved_orders)
+
+    def _kill_process(self, process: asyncio.subprocess.Process):
+        """终止子进程及其所在进程组"""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def _communicate(
+        self,
+        process: asyncio.subprocess.Process,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Tuple[bytes, bytes]:
+        """
+        等待子进程结束，请求被取消时终止子进程
+
+        返回:
+            (标准输出, 标准错误)
+        """
+        communicate = asyncio.ensure_future(process.communicate())
+        if cancel_token is None:
+            return await communicate
+
+        cancelled = asyncio.ensure_future(cancel_token.wait())
+        killed = False
+        try:
+            await asyncio.wait({communicate, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+            if not communicate.done():
+                # 请求已取消(或所在任务被取消)，终止仍在运行的Spark-TTS进程
+                if process.returncode is None:
+                    self._kill_process(process)
+                    killed = True
+                    metrics.inc("tts_killed_processes_total")
+                await communicate
+
+        if killed:
+            raise RequestCancelledError(cancel_token.reason)
+        return communicate.result()
 
     async def synthesize_multiple(
         self,
@@ -117,7 +245,8 @@ class TTSService:
         project_id: str,
         prompt_speech_path: Optional[str] = None,
         prompt_text: Optional[str] = None,
-        output_format: str = "wav"
+        output_format: str = "wav",
+        cancel_token: Optional[CancellationToken] = None
     ) -> Tuple[str, List[str]]:
         """
         合成多个句子为语音
@@ -127,19 +256,274 @@ class TTSService:
             project_id: 项目ID
             prompt_speech_path: 提示语音文件路径
             prompt_text: 提示文本
+            cancel_token: 请求的取消标记，取消后不再合成剩余句子
             
+        任一句子失败或请求被取消时，删除本次已生成的片段
+
         返回:
             (project_id, 生成的音频文件路径列表)
         """
+        if not project_id:
+            project_id = str(uuid.uuid4())
+
         output_files = []
-        for sentence in sentences:
-            _, output_path = await self.synthesize(
-                sentence,
-                project_id,
-                prompt_speech_path,
-                prompt_text,
-                output_format
-            )
-            output_files.append(output_path)
+        try:
+            if self.batch_scheduler:
+                # 启用动态批量时同时提交所有句子，使同一请求的句子也能合并生成
+                start_order = self._reserve_orders(project_id, len(sentences))
+                try:
+                    results = await asyncio.gather(*(
+                        self.synthesize(
+                            sentence,
+                            project_id,
+                            prompt_speech_path,
+                            prompt_text,
+                            output_format,
+                            order=start_order + index,
+                            cancel_token=cancel_token
+                        )
+                        for index, sentence in enumerate(sentences)
+                    ), return_exceptions=True)
+                finally:
+                    self._release_orders(project_id, range(start_order, start_order + len(sentences)))
+                output_files = [result[1] for result in results if not isinstance(result, BaseException)]
+                errors = [result for result in results if isinstance(result, BaseException)]
+                if errors:
+                    cancelled = [error for error in errors if isinstance(error, RequestCancelledError)]
+                    raise (cancelled or errors)[0]
+            else:
+                for sentence in sentences:
+                    _, output_path = await self.synthesize(
+                        sentence,
+                        project_id,
+                        prompt_speech_path,
+                        prompt_text,
+                        output_format,
+                        cancel_token=cancel_token
+                    )
+                    output_files.append(output_path)
+        except Exception as e:
+            if isinstance(e, RequestCancelledError):
+                # 已完成的句子之外，当前被终止的句子也未产出，一并计入跳过数
+                metrics.inc("tts_skipped_sentences_total", value=len(sentences) - len(output_files))
+            # 删除本次已生成的片段，任务重试时从头合成不会产生重复片段
+            self.remove_segments(project_id, output_files)
+            raise
             
-        return project_id, output_files
\ No newline at end of file
+        return project_id, output_files
+
+    def remove_segments(self, project_id: str, paths: List[str]):
+        """删除片段文件及其在项目清单中的记录"""
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.file_manager.update_segment_texts(project_id, {os.path.basename(path): None for path in paths})
+
+    async def resynthesize(
+        self,
+        sentences: List[str],
+        project_id: str,
+        prompt_speech_path: Optional[str] = None,
+        prompt_text: Optional[str] = None,
+        output_format: str = "wav",
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, int]:
+        """
+        按句比对修改后的全文与项目中已有片段的文本，只合成新增或修改的句子
+
+        参数:
+            sentences: 修改后全文的句子列表
+            project_id: 项目ID
+            prompt_speech_path: 提示语音文件路径
+            prompt_text: 提示文本
+            output_format: 新合成片段的输出格式
+            cancel_token: 请求的取消标记，取消时保持项目原有片段不变
+
+        返回:
+            统计信息 {total, reused, synthesized, removed}
+        """
+        files = sorted(
+            (f for f in self.file_manager.get_project_files(project_id) if f["order"] > 0),
+            key=lambda x: x["order"]
+        )
+        segment_texts = self.file_manager.load_segment_texts(project_id)
+        plan, removed = plan_segments([(f["filename"], segment_texts.get(f["filename"])) for f in files], sentences)
+
+        # 先用临时序号合成新句子，失败时不影响原有片段
+        pending_count = sum(1 for reuse, _ in plan if not reuse)
+        next_order = self._reserve_orders(project_id, pending_count)
+        own_orders = range(next_order, next_order + pending_count)
+        new_paths: List[str] = []
+        segments: List[Tuple[str, str]] = []
+        try:
+            try:
+                for reuse, sentence in plan:
+                    if reuse:
+                        segments.append((reuse, sentence))
+                        continue
+                    _, output_path = await self.synthesize(
+                        sentence,
+                        project_id,
+                        prompt_speech_path,
+                        prompt_text,
+                        output_format,
+                        order=next_order + len(new_paths),
+                        cancel_token=cancel_token
+                    )
+                    new_paths.append(output_path)
+                    segments.append((os.path.basename(output_path), sentence))
+            except Exception as e:
+                if isinstance(e, RequestCancelledError):
+                    metrics.inc("tts_skipped_sentences_total", value=pending_count - len(new_paths))
+                self.remove_segments(project_id, new_paths)
+                raise
+
+            # 删除不再使用的旧片段并重新编号，跳过并发请求已预留的序号
+            taken_orders = self._reserved_orders.get(project_id, set()) - set(own_orders)
+            await asyncio.to_thread(
+                self.file_manager.renumber_segments, project_id, segments, removed, taken_orders
+            )
+        finally:
+            self._release_orders(project_id, own_orders)
+
+        return {
+            "total": len(plan),
+            "reused": len(plan) - len(new_paths),
+            "synthesized": len(new_paths),
+            "removed": len(removed),
+        }
+
+    def _build_batch_worker_command(self) -> Tuple[List[str], Optional[str]]:
+        """
+        构建批量推理worker的命令行
+
+        返回:
+            (命令行参数列表, 工作目录)
+        """
+        worker_dir = os.path.dirname(os.path.abspath(protocol.__file__))
+        if self.settings.SPARK_TTS_BATCH_WORKER == "stub":
+            return [sys.executable, os.path.join(worker_dir, "stub_batch_worker.py")], None
+
+        cmd = [
+            self._get_spark_python(),
+            os.path.join(worker_dir, "spark_batch_worker.py"),
+            "--device", str(self.settings.SPARK_TTS_DEVICE),
+            "--model_dir", self.settings.SPARK_TTS_MODEL_DIR
+        ]
+        return cmd, self.settings.SPARK_TTS_ROOT_DIR
+
+    def _build_stream_worker_command(self) -> Tuple[List[str], Optional[str]]:
+        """
+        构建常驻流式推理worker的命令行，每次启动worker进程时调用
+
+        返回:
+            (命令行参数列表, 工作目录)
+        """
+        worker_dir = os.path.dirname(os.path.abspath(protocol.__file__))
+        if self.settings.SPARK_TTS_STREAM_WORKER == "stub":
+            cmd = [sys.executable, os.path.join(worker_dir, "stub_stream_worker.py")]
+            cmd.extend(shlex.split(self.settings.STREAM_STUB_WORKER_ARGS))
+            return cmd, None
+
+        cmd = [
+            self._get_spark_python(),
+            os.path.join(worker_dir, "spark_stream_worker.py"),
+            "--device", str(self.settings.SPARK_TTS_DEVICE),
+            "--model_dir", self.settings.SPARK_TTS_MODEL_DIR,
+            "--chunk_tokens", str(self.settings.STREAM_CHUNK_TOKENS)
+        ]
+        return cmd, self.settings.SPARK_TTS_ROOT_DIR
+
+    async def synthesize_stream(
+        self,
+        text: str,
+        project_id: str,
+        prompt_speech_path: Optional[str] = None,
+        prompt_text: Optional[str] = None,
+        order: Optional[int] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        流式合成单个文本，边生成边输出音频，同时将完整音频保存为项目片段
+
+        参数:
+            text: 要合成的文本
+            project_id: 项目ID
+            prompt_speech_path: 提示语音文件路径
+            prompt_text: 提示文本
+            order: 片段序号，为空时预留项目的下一个序号
+            cancel_token: 请求的取消标记，超过截止时间时终止推理worker
+
+        返回:
+            异步迭代器，首先输出WAV文件头，之后依次输出PCM音频块
+        """
+        reserved_orders = []
+        if order is None:
+            order = self._reserve_orders(project_id)
+            reserved_orders.append(order)
+        project_path = self.file_manager.get_project_path(project_id)
+        final_path = os.path.join(project_path, f"{order:03d}_{project_id}.wav")
+        part_path = f"{final_path}.{uuid.uuid4().hex}.part"
+
+        try:
+            worker = await self.stream_pool.acquire(cancel_token)
+        except BaseException:
+            self._release_orders(project_id, reserved_orders)
+            raise
+
+        wav_file = None
+        try:
+            await worker.send(
+                text,
+                prompt_speech_path or self.settings.DEFAULT_PROMPT_SPEECH_PATH or None,
+                prompt_text or self.settings.DEFAULT_PROMPT_TEXT or None
+            )
+            while True:
+                frame_type, payload = await worker.read_frame(cancel_token)
+
+                if frame_type == protocol.FRAME_ERROR:
+                    raise TTSError(f"Spark-TTS stream failed: {payload.decode('utf-8', errors='replace')}")
+
+                if frame_type == protocol.FRAME_START:
+                    if wav_file is not None:
+                        raise TTSError("Duplicate START frame from inference worker")
+                    params = protocol.parse_start_payload(payload)
+                    wav_file = wave.open(part_path, "wb")
+                    wav_file.setnchannels(params["channels"])
+                    wav_file.setsampwidth(params["sample_width"])
+                    wav_file.setframerate(params["sample_rate"])
+                    yield self.audio_processor.get_streaming_wav_header(
+                        params["sample_rate"], params["channels"], params["sample_width"]
+                    )
+                    continue
+
+                if wav_file is None:
+                    raise TTSError("Inference worker sent audio before START frame")
+
+                if frame_type == protocol.FRAME_CHUNK:
+                    wav_file.writeframes(payload)
+                    yield payload
+                elif frame_type == protocol.FRAME_END:
+                    break
+                else:
+                    raise TTSError(f"Unexpected frame type from inference worker: {frame_type}")
+
+            wav_file.close()
+            wav_file = None
+            os.replace(part_path, final_path)
+            self.file_manager.save_segment_text(project_id, os.path.basename(final_path), text)
+        except protocol.ProtocolError as e:
+            raise TTSError(f"Invalid stream from inference worker: {str(e)}")
+        finally:
+            # 客户端断开时取消会作用于之后的每个 await，同步清理必须在等待进程结束之前完成
+            self._release_orders(project_id, reserved_orders)
+            # 客户端断开(生成器被关闭)、超时或出错时worker仍在生成，只能终止进程
+            killed = self.stream_pool.release(worker)
+            if killed is not None:
+                metrics.inc("tts_killed_processes_total")
+            if wav_file is not None:
+                wav_file.close()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            if killed is not None:
+                await killed.wait()
@@ -0,0 +1,68 @@
+import difflib
+import os
+from typing import Iterable, List, Optional, Tuple
+
+
+def get_segment_order(filename: str) -> Optional[int]:
+    """
+    从片段文件名中解析序号
+
+    参数:
+        filename: 片段文件名，如 001_project.wav
+
+    返回:
+        序号，文件名不以序号开头时返回 None
+    """
+    prefix = filename.split("_", 1)[0]
+    return int(prefix) if prefix.isdigit() else None
+
+
+def plan_segments(
+    old_segments: List[Tuple[str, Optional[str]]],
+    sentences: List[str]
+) -> Tuple[List[Tuple[Optional[str], str]], List[str]]:
+    """
+    按句比对已有片段的文本与修改后的全文，决定每个句子复用哪个片段
+
+    参数:
+        old_segments: 按序号排列的已有片段 (文件名, 文本)，没有记录文本的片段无法比对，视为已修改
+        sentences: 修改后全文的句子列表
+
+    返回:
+        (计划, 删除的文件名)，计划中每个句子对应 (复用的片段文件名 或 None, 句子文本)，
+        None 表示需要重新合成
+    """
+    old_texts = [text for _, text in old_segments]
+    plan: List[Tuple[Optional[str], str]] = []
+    matcher = difflib.SequenceMatcher(None, old_texts, sentences, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for offset, sentence in enumerate(sentences[j1:j2]):
+            reuse = old_segments[i1 + offset][0] if tag == "equal" else None
+            plan.append((reuse, sentence))
+
+    kept = {reuse for reuse, _ in plan if reuse}
+    removed = [filename for filename, _ in old_segments if filename not in kept]
+    return plan, removed
+
+
+def assign_segment_names(filenames: List[str], project_id: str, taken_orders: Iterable[int] = ()) -> List[str]:
+    """
+    按顺序为片段分配从1开始的序号文件名，保留各自的扩展名
+
+    参数:
+        filenames: 按新顺序排列的片段文件名
+        project_id: 项目ID
+        taken_orders: 被其他片段占用(如并发写入中的片段)的序号，分配时跳过
+
+    返回:
+        与 filenames 一一对应的新文件名
+    """
+    taken = set(taken_orders)
+    names = []
+    order = 0
+    for filename in filenames:
+        order += 1
+        while order in taken:
+            order += 1
+        names.append(f"{order:03d}_{project_id}{os.path.splitext(filename)[1]}")
+    return names
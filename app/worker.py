@@ -0,0 +1,240 @@
+import os
+import time
+import signal
+import socket
+import uuid
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Set
+
+from app.core.config import get_settings
+from app.core.exceptions import RequestCancelledError
+from app.core.metrics import start_metrics_server
+from app.core.cancellation import (
+    CancellationToken,
+    CANCEL_CLIENT,
+    CANCEL_DEADLINE,
+    CANCEL_LEASE_LOST,
+    CANCEL_SHUTDOWN
+)
+from app.services.job_broker import JobBroker, get_job_broker, JOB_FAILED
+from app.services.tts_service import TTSService
+from app.utils.text_splitter import split_text_into_sentences
+
+logger = logging.getLogger(__name__)
+
+
+class SynthesisWorker:
+    def __init__(
+        self,
+        broker: Optional[JobBroker] = None,
+        tts_service: Optional[TTSService] = None,
+        worker_id: Optional[str] = None
+    ):
+        """初始化合成worker，从任务队列领取任务并调用 TTSService 执行"""
+        self.settings = get_settings()
+        self.broker = broker or get_job_broker()
+        self.tts_service = tts_service or TTSService()
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers = {
+            "synthesize": self._run_synthesize,
+            "resynthesize": self._run_resynthesize,
+        }
+        # 正在执行的任务的取消标记，停止时统一取消
+        self._active_tokens: Set[CancellationToken] = set()
+        self._stopping = asyncio.Event()
+
+    async def run_forever(self):
+        """
+        循环领取并执行任务，WORKER_CONCURRENCY 个循环并发运行
+
+        收到 SIGTERM/SIGINT 时停止领取新任务，并取消正在执行的任务: 终止其 Spark-TTS 进程
+        (子进程位于独立的进程组，不会随worker一起收到信号)，任务交还队列由其他worker重新执行
+        """
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+        metrics_server = None
+        try:
+            # 取消、终止进程等指标在worker进程内计数，需单独输出
+            if self.settings.WORKER_METRICS_PORT:
+                metrics_server = await start_metrics_server(
+                    self.settings.WORKER_METRICS_HOST, self.settings.WORKER_METRICS_PORT
+                )
+                logger.info(f"Serving worker metrics on port {self.settings.WORKER_METRICS_PORT}")
+            # 动态批量的常驻推理worker随本进程启动，批量只在合成worker中进行
+            await self.tts_service.start()
+            logger.info(f"Synthesis worker {self.worker_id} started")
+            await asyncio.gather(*(
+                self._run_loop() for _ in range(max(self.settings.WORKER_CONCURRENCY, 1))
+            ))
+        finally:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(signum)
+            if metrics_server is not None:
+                metrics_server.close()
+                await metrics_server.wait_closed()
+            await self.tts_service.close()
+        logger.info(f"Synthesis worker {self.worker_id} stopped")
+
+    def stop(self):
+        """停止领取新任务，并取消正在执行的任务"""
+        if self._stopping.is_set():
+            return
+        logger.info(f"Stopping synthesis worker {self.worker_id}")
+        self._stopping.set()
+        for token in list(self._active_tokens):
+            token.cancel(CANCEL_SHUTDOWN)
+
+    async def _run_loop(self):
+        while not self._stopping.is_set():
+            if not await self.run_once():
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.settings.WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self) -> bool:
+        """
+        领取并执行一个任务
+
+        返回:
+            是否领取到了任务
+        """
+        if self._stopping.is_set():
+            return False
+        # 执行它的worker崩溃后不会再被领取的任务在这里结束，并删除随任务提交的提示语音文件
+        for expired in await asyncio.to_thread(self.broker.reap_expired):
+            logger.warning(f"Job {expired['id']} lease expired, marked as {expired['status']}")
+            self._cleanup(expired["payload"])
+        job = await asyncio.to_thread(self.broker.lease, self.worker_id)
+        if job is None:
+            return False
+
+        # 请求的截止时间随任务一起提交，排队期间已过期的任务不再执行
+        deadline = job["payload"].get("deadline")
+        cancel_token = CancellationToken(deadline - time.time() if deadline else None)
+        if deadline and deadline <= time.time():
+            cancel_token.cancel(CANCEL_DEADLINE)
+        if job.get("cancel_requested"):
+            cancel_token.cancel(CANCEL_CLIENT)
+        if cancel_token.cancelled:
+            await asyncio.to_thread(self.broker.finish_cancelled, job["id"], self.worker_id, cancel_token.reason)
+            self._cleanup(job["payload"])
+            return True
+
+        # 领取任务期间收到停止信号时，任务直接交还队列
+        if self._stopping.is_set():
+            cancel_token.cancel(CANCEL_SHUTDOWN)
+        self._active_tokens.add(cancel_token)
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"], cancel_token))
+        try:
+            cancel_token.raise_if_cancelled()
+            handler = self._handlers.get(job["kind"])
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {job['kind']}")
+            result = await handler(job["payload"], cancel_token)
+        except RequestCancelledError as e:
+            if e.reason == CANCEL_LEASE_LOST:
+                # 本次写入的片段已在取消时删除，提示语音文件留给接手任务的worker
+                logger.warning(f"Job {job['id']} aborted: lease lost")
+            elif e.reason == CANCEL_SHUTDOWN:
+                logger.info(f"Job {job['id']} interrupted by shutdown, returning it to the queue")
+                await asyncio.to_thread(self.broker.release, job["id"], self.worker_id)
+            else:
+                logger.info(f"Job {job['id']} cancelled: {e.reason}")
+                await asyncio.to_thread(self.broker.finish_cancelled, job["id"], self.worker_id, e.reason)
+                self._cleanup(job["payload"])
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed on attempt {job['attempts']}: {str(e)}")
+            if not await asyncio.to_thread(self.broker.fail, job["id"], self.worker_id, str(e)):
+                logger.warning(f"Job {job['id']} lease was lost before the failure could be recorded")
+            failed_job = await asyncio.to_thread(self.broker.get, job["id"])
+            if failed_job and failed_job["status"] == JOB_FAILED:
+                self._cleanup(job["payload"])
+        else:
+            if await asyncio.to_thread(self.broker.complete, job["id"], self.worker_id, result):
+                self._cleanup(job["payload"])
+            else:
+                # 租约已过期，任务由其他worker重新执行，丢弃本次结果以免项目中出现重复片段
+                logger.warning(f"Job {job['id']} lease was lost before completion, discarding result")
+                self._discard_result(job["kind"], result)
+        finally:
+            heartbeat.cancel()
+            self._active_tokens.discard(cancel_token)
+        return True
+
+    async def _heartbeat(self, job_id: str, cancel_token: CancellationToken):
+        """定期延长租约，避免长任务被其他worker重复领取；同时检查任务是否被请求取消，租约丢失时中止执行"""
+        lease_interval = max(self.settings.JOB_VISIBILITY_TIMEOUT / 3, 1.0)
+        last_extended = time.monotonic()
+        while True:
+            await asyncio.sleep(self.settings.WORKER_POLL_INTERVAL)
+            job = await asyncio.to_thread(self.broker.get, job_id)
+            if job and job["cancel_requested"]:
+                cancel_token.cancel(CANCEL_CLIENT)
+                return
+            if time.monotonic() - last_extended >= lease_interval:
+                if not await asyncio.to_thread(self.broker.extend_lease, job_id, self.worker_id):
+                    # 租约已被其他worker接手，停止执行以免两个worker同时写入同一项目
+                    cancel_token.cancel(CANCEL_LEASE_LOST)
+                    return
+                last_extended = time.monotonic()
+
+    async def _run_synthesize(self, payload: Dict[str, Any], cancel_token: CancellationToken) -> Dict[str, Any]:
+        if payload.get("split_sentences"):
+            sentences = split_text_into_sentences(payload["text"])
+            project_id, output_files = await self.tts_service.synthesize_multiple(
+                sentences,
+                payload["project_id"],
+                payload.get("prompt_speech_path"),
+                payload.get("prompt_text"),
+                payload.get("output_format", "wav"),
+                cancel_token=cancel_token
+            )
+        else:
+            project_id, output_path = await self.tts_service.synthesize(
+                payload["text"],
+                payload["project_id"],
+                payload.get("prompt_speech_path"),
+                payload.get("prompt_text"),
+                payload.get("output_format", "wav"),
+                cancel_token=cancel_token
+            )
+            output_files = [output_path]
+        return {
+            "project_id": project_id,
+            "files": [os.path.basename(path) for path in output_files],
+        }
+
+    async def _run_resynthesize(self, payload: Dict[str, Any], cancel_token: CancellationToken) -> Dict[str, Any]:
+        stats = await self.tts_service.resynthesize(
+            split_text_into_sentences(payload["text"]),
+            payload["project_id"],
+            payload.get("prompt_speech_path"),
+            payload.get("prompt_text"),
+            payload.get("output_format", "wav"),
+            cancel_token=cancel_token
+        )
+        return {"project_id": payload["project_id"], **stats}
+
+    def _discard_result(self, kind: str, result: Dict[str, Any]):
+        """删除已失去租约的合成任务写入的片段；重新合成任务已就地重新编号，无法撤销"""
+        if kind != "synthesize":
+            return
+        project_path = self.tts_service.file_manager.get_project_path(result["project_id"])
+        self.tts_service.remove_segments(
+            result["project_id"],
+            [os.path.join(project_path, filename) for filename in result["files"]]
+        )
+
+    def _cleanup(self, payload: Dict[str, Any]):
+        """任务结束(成功、取消或最终失败)后删除随任务提交的临时提示语音文件"""
+        prompt_speech_path = payload.get("prompt_speech_path")
+        if prompt_speech_path and os.path.exists(prompt_speech_path):
+            os.remove(prompt_speech_path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(SynthesisWorker().run_forever())
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 必填配置项在测试中不会用到真实值，需在首次加载配置前设置
+os.environ.setdefault("API_KEY", "test-key")
+os.environ.setdefault("SPARK_TTS_ROOT_DIR", "/nonexistent/Spark-TTS")
+os.environ.setdefault("SPARK_TTS_MODEL_DIR", "pretrained_models/Spark-TTS-0.5B")
+
+from app.services.tts_service import TTSService  # noqa: E402
+
+
+@pytest.fixture
+def tts_service(tmp_path, monkeypatch):
+    """使用桩推理worker的 TTSService，项目文件写入临时目录"""
+    monkeypatch.chdir(tmp_path)
+    service = TTSService()
+    monkeypatch.setattr(service.settings, "SPARK_TTS_STREAM_WORKER", "stub")
+    monkeypatch.setattr(service.settings, "STREAM_STUB_WORKER_ARGS", "")
+    return service
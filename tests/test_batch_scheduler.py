@@ -0,0 +1,130 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from app.core.cancellation import CancellationToken, CANCEL_CLIENT
+from app.core.exceptions import RequestCancelledError
+from app.core.metrics import metrics
+from app.services.batch_scheduler import BatchScheduler
+from app.services.tts_service import TTSService
+
+STUB_WORKER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "inference", "stub_batch_worker.py"
+)
+AUDIO_MS_PER_CHAR = 10
+
+
+def make_scheduler(max_batch_size=4, max_wait_ms=50.0, length_bucket=0):
+    """使用桩批量worker的调度器，模拟生成不耗时，每个字符对应10毫秒音频"""
+    cmd = [
+        sys.executable, STUB_WORKER,
+        "--overhead_ms", "0", "--ms_per_char", "0", "--audio_ms_per_char", str(AUDIO_MS_PER_CHAR),
+    ]
+    scheduler = BatchScheduler((cmd, None), max_batch_size, max_wait_ms, length_bucket)
+    batches = []
+    run_batch = scheduler._run_batch
+
+    async def record_batch(batch):
+        batches.append([item.text for item in batch])
+        await run_batch(batch)
+
+    scheduler._run_batch = record_batch
+    return scheduler, batches
+
+
+def run(scenario, **kwargs):
+    """在新的事件循环中运行测试场景 scenario(scheduler, batches)，结束时关闭调度器"""
+    async def main():
+        scheduler, batches = make_scheduler(**kwargs)
+        await scheduler.start()
+        try:
+            await scenario(scheduler, batches)
+        finally:
+            await scheduler.close()
+    asyncio.run(main())
+
+
+def expected_pcm_size(text):
+    return len(text) * AUDIO_MS_PER_CHAR * 16000 // 1000 * 2
+
+
+def test_results_are_split_back_to_each_caller():
+    async def split(scheduler, batches):
+        texts = ["一", "二二", "三三三"]
+        results = await asyncio.gather(*(scheduler.submit(text) for text in texts))
+        assert batches == [texts]
+        for text, (pcm, params) in zip(texts, results):
+            assert len(pcm) == expected_pcm_size(text)
+            assert params == {"sample_rate": 16000, "channels": 1, "sample_width": 2}
+
+    run(split, max_batch_size=3)
+
+
+def test_sentences_are_grouped_by_voice_and_length():
+    async def grouping(scheduler, batches):
+        await asyncio.gather(
+            scheduler.submit("短句甲", "a.wav", "提示"),
+            scheduler.submit("短句乙", "b.wav", "提示"),
+            scheduler.submit("短句丙", "a.wav", "提示"),
+            scheduler.submit("这是一个比较长的句子", "a.wav", "提示"),
+        )
+        assert sorted(batches) == sorted([["短句甲", "短句丙"], ["短句乙"], ["这是一个比较长的句子"]])
+
+    run(grouping, max_batch_size=4, length_bucket=5)
+
+
+def test_partial_batch_waits_for_the_window():
+    async def window(scheduler, batches):
+        started = time.monotonic()
+        await scheduler.submit("一句")
+        elapsed = time.monotonic() - started
+        assert 0.2 <= elapsed < 1.0
+        assert batches == [["一句"]]
+
+    run(window, max_batch_size=4, max_wait_ms=200.0)
+
+
+def test_full_group_is_not_held_behind_an_older_partial_group():
+    async def full_first(scheduler, batches):
+        lone = asyncio.ensure_future(scheduler.submit("甲", "a.wav"))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        await asyncio.gather(scheduler.submit("乙", "b.wav"), scheduler.submit("丙", "b.wav"))
+        assert time.monotonic() - started < 0.5
+        await lone
+        assert batches == [["乙", "丙"], ["甲"]]
+
+    run(full_first, max_batch_size=2, max_wait_ms=1000.0)
+
+
+def test_cancelled_sentence_is_removed_from_the_queue():
+    async def cancel(scheduler, batches):
+        token = CancellationToken()
+        pending = asyncio.ensure_future(scheduler.submit("一句", cancel_token=token))
+        await asyncio.sleep(0.05)
+        assert metrics.get("tts_batch_pending") == 1
+        token.cancel(CANCEL_CLIENT)
+        with pytest.raises(RequestCancelledError):
+            await pending
+        assert metrics.get("tts_batch_pending") == 0
+        assert batches == []
+
+    run(cancel, max_batch_size=4, max_wait_ms=5000.0)
+
+
+def test_app_lifespan_starts_and_stops_batch_worker(tts_service, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import main
+
+    monkeypatch.setattr(tts_service.settings, "SPARK_TTS_BATCH_WORKER", "stub")
+    service = TTSService(enable_batching=True)
+    monkeypatch.setattr(main, "tts_service", service)
+
+    with TestClient(main.app):
+        process = service.batch_scheduler._process
+        assert process is not None and process.returncode is None
+    assert service.batch_scheduler._process is None
+    assert process.returncode is not None
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+
+import pytest
+
+from app.services.file_manager import FileManager
+
+
+def write_entries(base_dir, writer, count):
+    import os
+    os.chdir(base_dir)
+    file_manager = FileManager()
+    for index in range(count):
+        file_manager.save_segment_text("shared", f"{writer}_{index}.wav", f"{writer}-{index}")
+
+
+def test_concurrent_manifest_writers_keep_every_entry(tts_service, tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=write_entries, args=(str(tmp_path), writer, 25)) for writer in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    segment_texts = tts_service.file_manager.load_segment_texts("shared")
+    assert len(segment_texts) == 100
+    assert segment_texts["3_24.wav"] == "3-24"
+
+
+def make_project(tmp_path, segments):
+    """在项目 p 中写入片段文件及其清单记录，文件内容为文件名"""
+    file_manager = FileManager()
+    project_path = tmp_path / "generated_audio" / "p"
+    project_path.mkdir(parents=True, exist_ok=True)
+    for filename, text in segments.items():
+        (project_path / filename).write_text(filename)
+        file_manager.save_segment_text("p", filename, text)
+    return file_manager, project_path
+
+
+def audio_contents(project_path):
+    return {path.name: path.read_text() for path in sorted(project_path.glob("*.wav"))}
+
+
+def test_renumber_merges_manifest_and_keeps_concurrent_segments(tts_service, tmp_path):
+    file_manager, project_path = make_project(tmp_path, {
+        "001_p.wav": "甲", "002_p.wav": "乙", "003_p.wav": "丙", "004_p.wav": "并发", "005_p.wav": "新",
+    })
+
+    # 005 是新合成的片段；004 是并发写入的片段，不在计划中；2 已被并发请求预留但尚未写入
+    targets = file_manager.renumber_segments(
+        "p", [("003_p.wav", "丙"), ("005_p.wav", "新"), ("001_p.wav", "甲")], ["002_p.wav"], taken_orders=[2]
+    )
+
+    assert targets == ["001_p.wav", "003_p.wav", "005_p.wav"]
+    assert audio_contents(project_path) == {
+        "001_p.wav": "003_p.wav", "003_p.wav": "005_p.wav", "004_p.wav": "004_p.wav", "005_p.wav": "001_p.wav",
+    }
+    assert file_manager.load_segment_texts("p") == {
+        "001_p.wav": "丙", "003_p.wav": "新", "004_p.wav": "并发", "005_p.wav": "甲",
+    }
+
+
+def test_interrupted_renumber_is_finished_on_next_load(tts_service, tmp_path, monkeypatch):
+    file_manager, project_path = make_project(tmp_path, {"001_p.wav": "甲", "002_p.wav": "乙", "003_p.wav": "丙"})
+    (project_path / "009_p.wav").write_text("009_p.wav")
+
+    # 模拟进程在改名过程中退出: 第一个片段改为最终文件名后失败
+    rename = os.rename
+    calls = []
+
+    def crashing_rename(source, target):
+        calls.append(target)
+        if len(calls) == 4:
+            raise KeyboardInterrupt
+        rename(source, target)
+
+    monkeypatch.setattr(os, "rename", crashing_rename)
+    with pytest.raises(KeyboardInterrupt):
+        file_manager.renumber_segments("p", [("009_p.wav", "新"), ("003_p.wav", "丙"), ("001_p.wav", "甲")], ["002_p.wav"])
+    monkeypatch.setattr(os, "rename", rename)
+
+    assert [f["filename"] for f in sorted(file_manager.get_project_files("p"), key=lambda f: f["order"])] == [
+        "001_p.wav", "002_p.wav", "003_p.wav",
+    ]
+    assert audio_contents(project_path) == {"001_p.wav": "009_p.wav", "002_p.wav": "003_p.wav", "003_p.wav": "001_p.wav"}
+    assert file_manager.load_segment_texts("p") == {"001_p.wav": "新", "002_p.wav": "丙", "003_p.wav": "甲"}
+    assert list(project_path.glob("*.renumber")) == []
@@ -0,0 +1,168 @@
+import time
+
+from app.core.config import get_settings
+from app.services.job_broker import (
+    SQLiteJobBroker,
+    JOB_CANCELLED,
+    JOB_FAILED,
+    JOB_LEASED,
+    JOB_QUEUED,
+)
+
+
+def make_broker(tmp_path):
+    return SQLiteJobBroker(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_lease_skips_projects_with_a_running_job(tmp_path):
+    broker = make_broker(tmp_path)
+    first = broker.enqueue("synthesize", {"project_id": "p1"})
+    second = broker.enqueue("synthesize", {"project_id": "p1"})
+    other = broker.enqueue("synthesize", {"project_id": "p2"})
+
+    assert broker.lease("w1")["id"] == first
+    # 同一项目的第二个任务要等第一个任务结束后才能被领取
+    assert broker.lease("w2")["id"] == other
+    assert broker.lease("w3") is None
+
+    assert broker.complete(first, "w1")
+    job = broker.lease("w3")
+    assert job["id"] == second and job["status"] == JOB_LEASED
+
+
+def test_stream_hold_excludes_workers_from_the_project(tmp_path):
+    broker = make_broker(tmp_path)
+    hold = broker.hold_project("p1", "api", "stream")
+    queued = broker.enqueue("synthesize", {"project_id": "p1"})
+
+    assert hold is not None
+    assert broker.lease("w1") is None
+    # 项目已被占用时不能再次占用
+    assert broker.hold_project("p1", "api", "stream") is None
+
+    assert broker.complete(hold, "api")
+    assert broker.lease("w1")["id"] == queued
+    assert broker.hold_project("p1", "api", "stream") is None
+
+
+def test_expired_stream_hold_is_never_executed(tmp_path):
+    broker = make_broker(tmp_path)
+    hold = broker.hold_project("p1", "api", "stream", visibility_timeout=0.01)
+    time.sleep(0.02)
+
+    assert broker.lease("w1") is None
+    assert [job["id"] for job in broker.reap_expired()] == [hold]
+    assert broker.get(hold)["status"] == JOB_FAILED
+
+
+def test_leased_job_is_invisible_to_other_workers(tmp_path):
+    broker = make_broker(tmp_path)
+    job_id = broker.enqueue("synthesize", {"project_id": "p1"})
+
+    job = broker.lease("w1")
+    assert job["id"] == job_id and job["worker_id"] == "w1" and job["attempts"] == 1
+    assert broker.lease("w2") is None
+    # 只有持有租约的worker可以续约和提交结果
+    assert not broker.extend_lease(job_id, "w2")
+    assert not broker.complete(job_id, "w2")
+    assert broker.complete(job_id, "w1", {"files": []})
+    assert broker.get(job_id)["result"] == {"files": []}
+
+
+def test_failed_job_is_retried_with_backoff(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), "JOB_RETRY_BACKOFF", 0.05)
+    broker = make_broker(tmp_path)
+    job_id = broker.enqueue("synthesize", {"project_id": "p1"})
+
+    broker.lease("w1")
+    before = time.time()
+    assert broker.fail(job_id, "w1", "boom")
+    job = broker.get(job_id)
+    assert job["status"] == JOB_QUEUED and job["error"] == "boom"
+    assert job["available_at"] >= before + 0.05
+    assert broker.lease("w1") is None
+
+    time.sleep(0.06)
+    assert broker.lease("w1")["attempts"] == 2
+    # 第二次失败后退避时间翻倍
+    before = time.time()
+    broker.fail(job_id, "w1", "boom")
+    assert broker.get(job_id)["available_at"] >= before + 0.1
+
+
+def test_job_fails_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), "JOB_RETRY_BACKOFF", 0.0)
+    broker = make_broker(tmp_path)
+    job_id = broker.enqueue("synthesize", {"project_id": "p1"}, max_attempts=2)
+
+    broker.lease("w1")
+    broker.fail(job_id, "w1", "first")
+    assert broker.lease("w1")["attempts"] == 2
+    broker.fail(job_id, "w1", "second")
+
+    job = broker.get(job_id)
+    assert job["status"] == JOB_FAILED and job["error"] == "second"
+    assert broker.lease("w1") is None
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    broker = make_broker(tmp_path)
+    job_id = broker.enqueue("synthesize", {"project_id": "p1"}, max_attempts=2)
+
+    broker.lease("w1", visibility_timeout=0.01)
+    time.sleep(0.02)
+    job = broker.lease("w2")
+    assert job["id"] == job_id and job["worker_id"] == "w2" and job["attempts"] == 2
+    # 原worker已失去租约
+    assert not broker.extend_lease(job_id, "w1")
+    assert not broker.complete(job_id, "w1")
+
+
+def test_expired_job_at_max_attempts_is_reaped_with_its_payload(tmp_path):
+    broker = make_broker(tmp_path)
+    job_id = broker.enqueue("synthesize", {"project_id": "p1", "prompt_speech_path": "prompt.wav"}, max_attempts=1)
+
+    broker.lease("w1", visibility_timeout=0.01)
+    time.sleep(0.02)
+    assert broker.lease("w2") is None
+
+    reaped = broker.reap_expired()
+    assert [job["id"] for job in reaped] == [job_id]
+    assert reaped[0]["status"] == JOB_FAILED and reaped[0]["error"] == "Lease expired"
+    assert reaped[0]["payload"]["prompt_speech_path"] == "prompt.wav"
+    assert broker.reap_expired() == []
+
+
+def test_cancel_queued_job(tmp_path):
+    broker = make_broker(tmp_path)
+    job_id = broker.enqueue("synthesize", {"project_id": "p1"})
+
+    assert broker.cancel(job_id, "client") == JOB_CANCELLED
+    assert broker.get(job_id)["status"] == JOB_CANCELLED
+    assert broker.lease("w1") is None
+    assert broker.cancel(job_id, "client") is None
+
+
+def test_cancel_leased_job(tmp_path):
+    broker = make_broker(tmp_path)
+    job_id = broker.enqueue("synthesize", {"project_id": "p1"})
+    broker.lease("w1")
+
+    assert broker.cancel(job_id, "client") == JOB_LEASED
+    job = broker.get(job_id)
+    assert job["status"] == JOB_LEASED and job["cancel_requested"]
+
+    assert broker.finish_cancelled(job_id, "w1", "client")
+    job = broker.get(job_id)
+    assert job["status"] == JOB_CANCELLED and job["error"] == "Cancelled: client"
+
+
+def test_expired_cancelled_job_is_reaped_instead_of_retried(tmp_path):
+    broker = make_broker(tmp_path)
+    job_id = broker.enqueue("synthesize", {"project_id": "p1"})
+    broker.lease("w1", visibility_timeout=0.01)
+    broker.cancel(job_id, "client")
+    time.sleep(0.02)
+
+    assert broker.lease("w2") is None
+    assert [job["status"] for job in broker.reap_expired()] == [JOB_CANCELLED]
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from app.core.config import get_settings
+from app.services.rendition_cache import RenditionCache
+from app.services.stream_service import StreamService
+
+SEGMENT_BYTES = 1000
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """转码由写入固定大小文件的桩函数代替的缓存，项目 p 中有两个片段"""
+    monkeypatch.chdir(tmp_path)
+    settings = get_settings()
+    monkeypatch.setattr(settings, "HLS_RENDITIONS", "original,opus_64k,aac_64k,aac_24k,mp3_128k")
+    monkeypatch.setattr(settings, "RENDITION_CACHE_DIR", "")
+    monkeypatch.setattr(settings, "RENDITION_CACHE_MAX_MB", 1.0)
+    project_path = tmp_path / "generated_audio" / "p"
+    project_path.mkdir(parents=True)
+    for name in ("001_p.wav", "001_p_old.wav"):
+        (project_path / name).write_bytes(b"RIFF" + name.encode())
+
+    cache = RenditionCache()
+    cache.transcoded = []
+
+    def transcode(input_path, output_path, output_format, codec=None, bitrate=None):
+        cache.transcoded.append((os.path.basename(input_path), os.path.basename(output_path), output_format))
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "wb") as f:
+            f.write(b"\0" * SEGMENT_BYTES)
+        return output_path
+
+    monkeypatch.setattr(cache.audio_processor, "transcode", transcode)
+    return cache
+
+
+def test_segment_matches_exact_stem(cache):
+    path, media_type = cache.get_segment("p", "aac_64k", "001_p.aac")
+
+    assert cache.transcoded == [("001_p.wav", "001_p.aac", "adts")]
+    assert path.endswith(os.path.join("aac_64k", "p", "001_p.aac"))
+    assert media_type == "audio/aac"
+    # 前缀相同的其他片段不会被误用
+    cache.get_segment("p", "aac_64k", "001_p_old.aac")
+    assert cache.transcoded[-1][0] == "001_p_old.wav"
+    with pytest.raises(FileNotFoundError):
+        cache.get_segment("p", "aac_64k", "001.aac")
+
+
+@pytest.mark.parametrize("filename", ["001_p.mp3", "001_p.wav", "001_p.aac.part", "001_p"])
+def test_segment_with_wrong_extension_is_rejected(cache, filename):
+    with pytest.raises(FileNotFoundError):
+        cache.get_segment("p", "aac_64k", filename)
+    assert cache.transcoded == []
+
+
+def test_unknown_or_disabled_rendition_is_rejected(cache):
+    for rendition in ("flac", "aac_32k"):
+        with pytest.raises(KeyError):
+            cache.get_segment("p", rendition, "001_p.aac")
+
+
+def test_cached_segment_is_reused_until_source_changes(cache, tmp_path):
+    first, _ = cache.get_segment("p", "mp3_128k", "001_p.mp3")
+    second, _ = cache.get_segment("p", "mp3_128k", "001_p.mp3")
+    assert first == second
+    assert len(cache.transcoded) == 1
+
+    # 片段被重新合成后缓存失效
+    source = tmp_path / "generated_audio" / "p" / "001_p.wav"
+    cached_mtime = os.path.getmtime(first)
+    os.utime(source, (cached_mtime + 10, cached_mtime + 10))
+    cache.get_segment("p", "mp3_128k", "001_p.mp3")
+    assert len(cache.transcoded) == 2
+
+
+def test_least_recently_used_segment_is_evicted(cache):
+    cache.max_bytes = 2 * SEGMENT_BYTES
+    first, _ = cache.get_segment("p", "aac_64k", "001_p.aac")
+    second, _ = cache.get_segment("p", "aac_24k", "001_p.aac")
+    # 再次访问后 first 变为最近使用
+    cache.get_segment("p", "aac_64k", "001_p.aac")
+    third, _ = cache.get_segment("p", "mp3_128k", "001_p.mp3")
+
+    assert os.path.exists(first) and os.path.exists(third)
+    assert not os.path.exists(second)
+    assert cache._total_bytes == 2 * SEGMENT_BYTES
+
+    # 被淘汰的片段再次请求时重新转码
+    cache.get_segment("p", "aac_24k", "001_p.aac")
+    assert len(cache.transcoded) == 4
+
+
+def test_master_playlist_only_offers_hls_renditions(cache):
+    assert cache.get_hls_renditions() == ["aac_64k", "aac_24k", "mp3_128k"]
+
+    playlist = StreamService().generate_master_playlist("p", cache.get_hls_renditions())
+
+    assert "/spark/stream/p/mp3_128k" in playlist
+    assert "/spark/stream/p/aac_64k" in playlist
+    assert "opus" not in playlist and "original" not in playlist
@@ -0,0 +1,48 @@
+from app.utils.segment_diff import assign_segment_names, get_segment_order, plan_segments
+
+OLD = [("001_p.wav", "甲。"), ("002_p.wav", "乙。"), ("003_p.wav", "丙。")]
+
+
+def test_unchanged_text_reuses_every_segment():
+    plan, removed = plan_segments(OLD, ["甲。", "乙。", "丙。"])
+
+    assert plan == [("001_p.wav", "甲。"), ("002_p.wav", "乙。"), ("003_p.wav", "丙。")]
+    assert removed == []
+
+
+def test_modified_sentence_is_replaced():
+    plan, removed = plan_segments(OLD, ["甲。", "乙乙。", "丙。"])
+
+    assert plan == [("001_p.wav", "甲。"), (None, "乙乙。"), ("003_p.wav", "丙。")]
+    assert removed == ["002_p.wav"]
+
+
+def test_deleted_and_inserted_sentences():
+    plan, removed = plan_segments(OLD, ["新。", "甲。", "丙。"])
+
+    assert plan == [(None, "新。"), ("001_p.wav", "甲。"), ("003_p.wav", "丙。")]
+    assert removed == ["002_p.wav"]
+
+
+def test_segment_without_recorded_text_is_resynthesized():
+    plan, removed = plan_segments([("001_p.wav", None), ("002_p.wav", "乙。")], ["甲。", "乙。"])
+
+    assert plan == [(None, "甲。"), ("002_p.wav", "乙。")]
+    assert removed == ["001_p.wav"]
+
+
+def test_segments_are_renumbered_in_order_keeping_extensions():
+    names = assign_segment_names(["010_p.wav", "003_p.mp3", "007_p.wav"], "p")
+
+    assert names == ["001_p.wav", "002_p.mp3", "003_p.wav"]
+
+
+def test_renumbering_skips_taken_orders():
+    names = assign_segment_names(["005_p.wav", "006_p.wav", "007_p.wav"], "p", taken_orders=[2, 3])
+
+    assert names == ["001_p.wav", "004_p.wav", "005_p.wav"]
+
+
+def test_segment_order_is_parsed_from_filename():
+    assert get_segment_order("012_p.wav") == 12
+    assert get_segment_order("intro.wav") is None
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import wave
+
+from app.core.exceptions import TTSError
+from app.core.metrics import metrics
+
+TEXT = "你好世界"  # 桩worker按每字150毫秒生成音频，共3个200毫秒的音频块
+
+
+def collect_stream(service, project_id, text=TEXT):
+    """消费流式合成的输出，返回 (已收到的数据块, 抛出的异常)"""
+    chunks = []
+
+    async def run():
+        try:
+            async for chunk in service.synthesize_stream(text, project_id):
+                chunks.append(chunk)
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(run())
+    except TTSError as e:
+        return chunks, e
+    return chunks, None
+
+
+def project_files(service, project_id):
+    """项目目录中的文件，不含锁文件等隐藏文件"""
+    names = os.listdir(service.file_manager.get_project_path(project_id))
+    return sorted(name for name in names if not name.startswith("."))
+
+
+def test_stream_assembles_segment(tts_service):
+    chunks, error = collect_stream(tts_service, "ok")
+
+    assert error is None
+    header, pcm_chunks = chunks[0], chunks[1:]
+    assert header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+    assert len(pcm_chunks) == 3
+
+    # 完整音频在 END 之后才从 .part 文件重命名为片段
+    assert project_files(tts_service, "ok") == ["001_ok.wav", "manifest.json"]
+    with wave.open(os.path.join(tts_service.file_manager.get_project_path("ok"), "001_ok.wav"), "rb") as f:
+        assert (f.getframerate(), f.getnchannels(), f.getsampwidth()) == (16000, 1, 2)
+        assert f.readframes(f.getnframes()) == b"".join(pcm_chunks)
+    assert tts_service.file_manager.load_segment_texts("ok") == {"001_ok.wav": TEXT}
+
+
+def test_stream_error_frame_discards_segment(tts_service, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "STREAM_STUB_WORKER_ARGS", "--fail_after 2")
+
+    chunks, error = collect_stream(tts_service, "fail")
+
+    assert isinstance(error, TTSError)
+    assert "failed after 2 chunks" in error.message
+    assert len(chunks) == 3  # WAV文件头和出错前的2个音频块
+    assert project_files(tts_service, "fail") == []
+
+
+def test_stream_sequence_gap_is_rejected(tts_service, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "STREAM_STUB_WORKER_ARGS", "--skip_seq_after 1")
+
+    chunks, error = collect_stream(tts_service, "gap")
+
+    assert isinstance(error, TTSError)
+    assert "out of sequence" in error.message
+    assert len(chunks) == 2
+    assert project_files(tts_service, "gap") == []
+
+
+def test_concurrent_streams_get_distinct_orders(tts_service, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "STREAM_STUB_WORKER_ARGS", "--delay 0.01")
+
+    async def run():
+        async def consume(text):
+            return [chunk async for chunk in tts_service.synthesize_stream(text, "seq")]
+        try:
+            await asyncio.gather(consume("一二"), consume("三四"))
+        finally:
+            await tts_service.close()
+
+    asyncio.run(run())
+
+    assert project_files(tts_service, "seq") == ["001_seq.wav", "002_seq.wav", "manifest.json"]
+
+
+def run_streams(service, *requests):
+    """在同一事件循环中依次执行流式合成请求 (项目ID, 最多读取的数据块数)，返回每个请求使用的worker进程号"""
+    pids = []
+
+    async def run():
+        try:
+            for project_id, max_chunks in requests:
+                stream = service.synthesize_stream(TEXT, project_id)
+                try:
+                    count = 0
+                    async for _ in stream:
+                        count += 1
+                        if count == max_chunks:
+                            break
+                except TTSError:
+                    pass
+                finally:
+                    pids.append(service.stream_pool.workers[0].process.pid
+                                if service.stream_pool.workers[0].process else None)
+                    await stream.aclose()
+        finally:
+            await service.close()
+
+    asyncio.run(run())
+    return pids
+
+
+def test_resident_worker_serves_consecutive_streams(tts_service):
+    killed = metrics.get("tts_killed_processes_total")
+
+    pids = run_streams(tts_service, ("a", None), ("b", None))
+
+    assert pids[0] is not None and pids[0] == pids[1]
+    assert metrics.get("tts_killed_processes_total") == killed
+    assert project_files(tts_service, "a") == ["001_a.wav", "manifest.json"]
+    assert project_files(tts_service, "b") == ["001_b.wav", "manifest.json"]
+
+
+def test_worker_is_reused_after_error_frame(tts_service, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "STREAM_STUB_WORKER_ARGS", "--fail_after 1")
+
+    pids = run_streams(tts_service, ("a", None), ("b", None))
+
+    assert pids[0] is not None and pids[0] == pids[1]
+    assert project_files(tts_service, "a") == [] and project_files(tts_service, "b") == []
+
+
+def test_worker_is_restarted_after_broken_stream(tts_service, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "STREAM_STUB_WORKER_ARGS", "--skip_seq_after 1")
+    killed = metrics.get("tts_killed_processes_total")
+
+    pids = run_streams(tts_service, ("a", None), ("b", None))
+
+    # 丢帧后worker状态未知，进程被终止，下一个请求重新启动
+    assert pids[0] is None and pids[1] is None
+    assert metrics.get("tts_killed_processes_total") == killed + 2
+
+
+def test_closing_stream_early_kills_worker(tts_service, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "STREAM_STUB_WORKER_ARGS", "--delay 0.05")
+    killed = metrics.get("tts_killed_processes_total")
+
+    pids = run_streams(tts_service, ("a", 2), ("b", None))
+
+    assert metrics.get("tts_killed_processes_total") == killed + 1
+    assert project_files(tts_service, "a") == []
+    assert project_files(tts_service, "b") == ["001_b.wav", "manifest.json"]
+
+
+def test_stream_holds_project_against_broker_workers(tts_service, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import main
+    from app.services.job_broker import SQLiteJobBroker, JOB_SUCCEEDED
+
+    broker = SQLiteJobBroker(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(main, "job_broker", broker)
+    monkeypatch.setattr(main, "tts_service", tts_service)
+    headers = {"X-API-Key": tts_service.settings.API_KEY}
+
+    with TestClient(main.app) as client:
+        # worker 正在执行该项目的任务时拒绝流式合成
+        job_id = broker.enqueue("synthesize", {"project_id": "busy"})
+        broker.lease("w1")
+        response = client.post("/synthesize/stream", data={"text": TEXT, "project_id": "busy"}, headers=headers)
+        assert response.status_code == 409
+        broker.complete(job_id, "w1")
+
+        response = client.post("/synthesize/stream", data={"text": TEXT, "project_id": "busy"}, headers=headers)
+        assert response.status_code == 200
+        assert project_files(tts_service, "busy") == ["001_busy.wav", "manifest.json"]
+
+    holds = broker._connect().execute("SELECT status FROM jobs WHERE kind = 'stream'").fetchall()
+    assert [row["status"] for row in holds] == [JOB_SUCCEEDED]
@@ -0,0 +1,154 @@
+import asyncio
+import os
+import signal
+import socket
+import time
+
+from app.core.cancellation import CANCEL_DEADLINE
+from app.core.exceptions import TTSError
+from app.core.metrics import metrics
+from app.services.job_broker import SQLiteJobBroker, JOB_CANCELLED, JOB_FAILED, JOB_QUEUED, JOB_SUCCEEDED
+from app.services.batch_scheduler import BatchScheduler
+from app.services.tts_service import TTSService
+from app.worker import SynthesisWorker
+
+SENTENCES = "第一句话。 第二句话。 第三句话。 第四句话。"
+
+
+def fake_synthesize(service, fail_on):
+    """替换 TTSService.synthesize，直接写入片段；第 fail_on 次调用抛出 TTSError"""
+    calls = []
+
+    async def synthesize(text, project_id=None, prompt_speech_path=None, prompt_text=None,
+                         output_format="wav", split_sentences=False, order=None, cancel_token=None):
+        calls.append(text)
+        await asyncio.sleep(0)
+        if len(calls) == fail_on:
+            raise TTSError("simulated inference failure")
+        if order is None:
+            order = service.file_manager.get_next_order_index(project_id)
+        path = service.file_manager.save_audio(b"RIFF", project_id, order, "wav")
+        service.file_manager.save_segment_text(project_id, os.path.basename(path), text)
+        return project_id, path
+
+    return synthesize
+
+
+def test_failed_attempt_leaves_no_segments_for_retry(tts_service, tmp_path, monkeypatch):
+    monkeypatch.setattr(tts_service.settings, "JOB_RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(tts_service, "synthesize", fake_synthesize(tts_service, fail_on=3))
+    broker = SQLiteJobBroker(str(tmp_path / "jobs.sqlite3"))
+    worker = SynthesisWorker(broker=broker, tts_service=tts_service, worker_id="w1")
+    job_id = broker.enqueue("synthesize", {"text": SENTENCES, "project_id": "retry", "split_sentences": True})
+
+    assert asyncio.run(worker.run_once())
+    job = broker.get(job_id)
+    assert job["status"] == JOB_QUEUED and job["attempts"] == 1
+    assert tts_service.file_manager.get_project_files("retry") == []
+
+    assert asyncio.run(worker.run_once())
+    job = broker.get(job_id)
+    assert job["status"] == JOB_SUCCEEDED
+    files = sorted(f["filename"] for f in tts_service.file_manager.get_project_files("retry"))
+    assert files == ["001_retry.wav", "002_retry.wav", "003_retry.wav", "004_retry.wav"]
+    assert list(tts_service.file_manager.load_segment_texts("retry").values()) == SENTENCES.split(" ")
+
+
+def test_prompt_of_dead_lettered_job_is_removed(tts_service, tmp_path):
+    broker = SQLiteJobBroker(str(tmp_path / "jobs.sqlite3"))
+    worker = SynthesisWorker(broker=broker, tts_service=tts_service, worker_id="w2")
+    prompt = tmp_path / "prompt.wav"
+    prompt.write_bytes(b"RIFF")
+    job_id = broker.enqueue(
+        "synthesize",
+        {"text": "一句话", "project_id": "crashed", "prompt_speech_path": str(prompt)},
+        max_attempts=1
+    )
+    # 领取任务的worker崩溃，租约过期
+    broker.lease("w1", visibility_timeout=0.01)
+    time.sleep(0.02)
+
+    assert not asyncio.run(worker.run_once())
+    assert broker.get(job_id)["status"] == JOB_FAILED
+    assert not prompt.exists()
+
+def test_sigterm_returns_running_job_to_the_queue(tts_service, tmp_path, monkeypatch):
+    started = asyncio.Event()
+
+    async def synthesize(*args, cancel_token=None, **kwargs):
+        started.set()
+        await cancel_token.wait()
+        cancel_token.raise_if_cancelled()
+
+    monkeypatch.setattr(tts_service, "synthesize", synthesize)
+    broker = SQLiteJobBroker(str(tmp_path / "jobs.sqlite3"))
+    worker = SynthesisWorker(broker=broker, tts_service=tts_service, worker_id="w1")
+    job_id = broker.enqueue("synthesize", {"text": "一句话", "project_id": "stop"})
+
+    async def run():
+        running = asyncio.ensure_future(worker.run_forever())
+        await asyncio.wait_for(started.wait(), timeout=5)
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(running, timeout=5)
+
+    asyncio.run(run())
+
+    job = broker.get(job_id)
+    assert job["status"] == JOB_QUEUED and job["attempts"] == 0
+    assert job["worker_id"] is None
+
+
+def test_worker_serves_its_own_metrics(tts_service, tmp_path, monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    monkeypatch.setattr(tts_service.settings, "WORKER_METRICS_HOST", "127.0.0.1")
+    monkeypatch.setattr(tts_service.settings, "WORKER_METRICS_PORT", port)
+    broker = SQLiteJobBroker(str(tmp_path / "jobs.sqlite3"))
+    worker = SynthesisWorker(broker=broker, tts_service=tts_service, worker_id="w1")
+    # 排队期间已过期的任务由worker取消，只在worker进程内计数
+    job_id = broker.enqueue("synthesize", {"text": "一句话", "project_id": "expired", "deadline": time.time() - 1})
+    before = metrics.get("tts_cancellations_total", {"reason": CANCEL_DEADLINE})
+
+    async def scrape():
+        running = asyncio.ensure_future(worker.run_forever())
+        while broker.get(job_id)["status"] != JOB_CANCELLED:
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: worker\r\n\r\n")
+        response = (await reader.read()).decode()
+        writer.close()
+        worker.stop()
+        await running
+        return response
+
+    response = asyncio.run(scrape())
+
+    assert response.startswith("HTTP/1.1 200")
+    assert f'tts_cancellations_total{{reason="deadline"}} {before + 1}' in response
+
+
+def test_worker_runs_batch_worker_for_its_lifetime(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    service = TTSService(enable_batching=True)
+    monkeypatch.setattr(service.settings, "SPARK_TTS_BATCH_WORKER", "stub")
+    service.batch_scheduler = BatchScheduler(service._build_batch_worker_command(), max_wait_ms=0.0)
+    broker = SQLiteJobBroker(str(tmp_path / "jobs.sqlite3"))
+    worker = SynthesisWorker(broker=broker, tts_service=service, worker_id="w1")
+    job_id = broker.enqueue("synthesize", {"text": "一句话", "project_id": "batched"})
+
+    async def run():
+        running = asyncio.ensure_future(worker.run_forever())
+        while broker.get(job_id)["status"] != JOB_SUCCEEDED:
+            await asyncio.sleep(0.01)
+        process = service.batch_scheduler._process
+        assert process is not None and process.returncode is None
+        worker.stop()
+        await running
+        return process
+
+    process = asyncio.run(run())
+
+    assert process.returncode is not None
+    assert service.batch_scheduler._process is None
+    assert broker.get(job_id)["result"]["files"] == ["001_batched.wav"]